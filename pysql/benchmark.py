@@ -0,0 +1,500 @@
+"""
+benchmark.py
+====================================
+Benchmarks against a local SQLite stand-in
+
+    python -m pysql.benchmark run --rows 200000 --columns 40 --output current.json
+    python -m pysql.benchmark compare baseline.json current.json --threshold 0.2
+    python -m pysql.benchmark scaling --rows 100000 --columns 300 --processes 1 2 4 8
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import datetime
+import platform
+import argparse
+import contextlib
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pysql.io as io
+import pysql.pool as pool
+import pysql.ingest as ingest
+import pysql.pivot as pivot
+import pysql.catalog as catalog
+import pysql.validate as validate
+import pysql.profiler as profiler
+
+
+SERVER = 'benchmark'
+DATABASE = 'benchmark'
+TABLE = 'bench'
+PIVOT_COLUMN = 'segment'
+
+# sqlite declared type -> SQL Server type reported in INFORMATION_SCHEMA
+_SQLITE_TYPES = {'INTEGER': 'int', 'INT': 'int', 'BIGINT': 'bigint', 'REAL': 'float',
+                 'FLOAT': 'float', 'TEXT': 'nvarchar', 'TIMESTAMP': 'datetime', 'DATE': 'date'}
+
+# sqlite declared type -> python type reported in cursor.description, as pyodbc does
+_SQLITE_PYTHON_TYPES = {'INTEGER': int, 'INT': int, 'BIGINT': int, 'REAL': float, 'FLOAT': float,
+                        'TEXT': str, 'TIMESTAMP': datetime.datetime, 'DATE': datetime.date}
+
+
+class _StandInCursor():
+    # the part of the pyodbc cursor used by pysql
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._query = None
+        self._params = None
+        self._types = None
+        self.fast_executemany = False
+
+    def execute(self, query, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+
+        self._cursor.execute(query, params)
+        self._query, self._params, self._types = query, params, None
+        return self
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(query, rows)
+
+    def setinputsizes(self, sizes):
+        pass
+
+    @property
+    def description(self):
+        description = self._cursor.description
+        if description is None:
+            return None
+
+        if self._types is None:
+            self._types = self._declaredTypes(len(description))
+
+        return [(col[0], python_type, None, None, None, None, True)
+                for col, python_type in zip(description, self._types)]
+
+    def _declaredTypes(self, n):
+        # sqlite reports no column types: they are read from a view over the query.
+        # Views take no parameters, and expressions have no declared type, both report None
+        types = [None] * n
+        if self._params:
+            return types
+
+        cursor = self._cursor.connection.cursor()
+        try:
+            cursor.execute(f"CREATE TEMP VIEW _pysql_describe AS {self._query.strip().rstrip(';')}")
+            try:
+                columns = cursor.execute("PRAGMA temp.table_info(_pysql_describe)").fetchall()
+            finally:
+                cursor.execute("DROP VIEW temp._pysql_describe")
+        except sqlite3.Error:
+            return types
+        finally:
+            cursor.close()
+
+        if len(columns) != n:
+            return types
+
+        return [_SQLITE_PYTHON_TYPES.get(col[2].upper()) for col in columns]
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, n):
+        return self._cursor.fetchmany(n)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def nextset(self):
+        return False
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self._cursor.close()
+
+
+class _StandInConnection():
+    # the part of the pyodbc connection used by pysql
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _StandInCursor(self._conn.cursor())
+
+    def execute(self, query, *params):
+        return self.cursor().execute(query, *params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def sqliteConnect(directory):
+    """
+    Connection factory for pool.ConnectionPool which opens {directory}/{database}.db
+    with SQLite instead of SQL Server. INFORMATION_SCHEMA.COLUMNS and TABLES and DB_NAME()
+    are provided for the schema catalog.
+    Only queries in the common subset of T-SQL and SQLite run, e.g. not TOP.
+
+    :param directory: Directory of the SQLite files
+    :type directory: str
+    """
+    def connect(server, database):
+        conn = sqlite3.connect(os.path.join(directory, database + '.db'), check_same_thread=False)
+        conn.create_function('DB_NAME', 0, lambda: database)
+
+        conn.execute("ATTACH DATABASE ':memory:' AS INFORMATION_SCHEMA")
+        conn.execute("""CREATE TABLE INFORMATION_SCHEMA.COLUMNS (TABLE_CATALOG, TABLE_SCHEMA, TABLE_NAME,
+                            COLUMN_NAME, ORDINAL_POSITION, IS_NULLABLE, DATA_TYPE,
+                            CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE)""")
+        conn.execute("CREATE TABLE INFORMATION_SCHEMA.TABLES (TABLE_CATALOG, TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE)")
+
+        tables = conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'").fetchall()
+        for (table,) in tables:
+            conn.execute("INSERT INTO INFORMATION_SCHEMA.TABLES VALUES (?, 'dbo', ?, 'BASE TABLE')",
+                         (database, table))
+
+            for position, name, data_type, notnull, _, _ in conn.execute(f"PRAGMA main.table_info([{table}])"):
+                data_type = _SQLITE_TYPES.get(data_type.upper(), data_type.lower() or 'nvarchar')
+                conn.execute("INSERT INTO INFORMATION_SCHEMA.COLUMNS VALUES (?, 'dbo', ?, ?, ?, ?, ?, ?, NULL, NULL)",
+                             (database, table, name, position + 1, 'NO' if notnull else 'YES', data_type,
+                              -1 if data_type == 'nvarchar' else None))
+
+        conn.commit()
+
+        return _StandInConnection(conn)
+
+    return connect
+
+
+def makeTable(rows=100000, columns=20, segments=100, null_rate=0.05, seed=0):
+    """
+    Synthetic table: a text segment column, then alternating integer and float columns
+    with null_rate of their values null.
+
+    :param rows: Rows
+    :type rows: int
+    :param columns: Columns besides the segment column
+    :type columns: int
+    :param segments: Distinct segments
+    :type segments: int
+    :param null_rate: Share of null values
+    :type null_rate: float
+    :param seed: Random seed
+    :type seed: int
+    """
+    rng = np.random.default_rng(seed)
+
+    data = {PIVOT_COLUMN: np.char.add('seg', rng.integers(0, segments, rows).astype(str))}
+
+    for i in range(columns):
+        nulls = rng.random(rows) < null_rate
+
+        if i % 2 == 0:
+            values = pd.array(rng.integers(1, 1000, rows), dtype='Int64')
+            values[nulls] = pd.NA
+            data[f"int_{i}"] = values
+        else:
+            values = rng.random(rows) * 1000
+            values[nulls] = np.nan
+            data[f"float_{i}"] = values
+
+    return pd.DataFrame(data)
+
+
+def writeTable(df, directory, database=DATABASE, table=TABLE):
+    """
+    Writes a table to the SQLite stand-in.
+    """
+    conn = sqlite3.connect(os.path.join(directory, database + '.db'))
+
+    try:
+        df.to_sql(table, conn, index=False, if_exists='replace')
+    finally:
+        conn.close()
+
+
+def _cases(df, segments):
+    # name -> (function, rows processed)
+    pivot_df = pd.DataFrame(np.random.default_rng(1).normal(5, 2, (segments, df.shape[1] - 1)),
+                            index=[f"seg{i}" for i in range(segments)], columns=df.columns[1:])
+    dense_mask = {x: pivot_df.columns.tolist() for x in pivot_df.index}
+    sparse_mask = {x: pivot_df.columns[:2].tolist() for x in pivot_df.index}
+
+    def quiet(func, *args, **kwargs):
+        # validate prints its verdict
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            return func(*args, **kwargs)
+
+    def iterate():
+        for _ in io.iterQuery(SERVER, DATABASE, f"SELECT * FROM {TABLE}"):
+            pass
+
+    return {'io.executeQuery': (lambda: io.executeQuery(SERVER, DATABASE, f"SELECT * FROM {TABLE}", cache=False),
+                                df.shape[0]),
+            'io.iterQuery': (iterate, df.shape[0]),
+            'io.executeQueryColumnar': (lambda: io.executeQueryColumnar(SERVER, DATABASE, f"SELECT * FROM {TABLE}"),
+                                        df.shape[0]),
+            'pivot.NullEntries': (lambda: pivot.NullEntries(SERVER, DATABASE, TABLE, PIVOT_COLUMN), df.shape[0]),
+            'pivot.SumValues': (lambda: pivot.SumValues(SERVER, DATABASE, TABLE, PIVOT_COLUMN), df.shape[0]),
+            'pivot.NullEntriesFrame': (lambda: pivot.NullEntriesFrame(df, PIVOT_COLUMN), df.shape[0]),
+            'ingest.profileColumns': (lambda: ingest.profileColumns(df), df.shape[0]),
+            'validate.expectGreaterThanZero dense': (lambda: quiet(validate.expectGreaterThanZero,
+                                                                   pivot_df, dense_mask, sparse=False),
+                                                     pivot_df.size),
+            'validate.expectGreaterThanZero sparse': (lambda: quiet(validate.expectGreaterThanZero,
+                                                                    pivot_df, sparse_mask, sparse=True),
+                                                      pivot_df.size)}
+
+
+def _measure(func, repeat):
+    func()
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    # a separate traced run, tracemalloc slows the code it traces
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def run(rows=100000, columns=20, segments=100, null_rate=0.05, repeat=5, cases=None,
+        connect=None, seed=0):
+    """
+    Runs the benchmarks on a synthetic table and returns the results.
+
+    :param rows: Rows of the synthetic table
+    :type rows: int
+    :param columns: Columns of the synthetic table
+    :type columns: int
+    :param segments: Segments of the synthetic table, and rows of the expectGreaterThanZero pivot
+    :type segments: int
+    :param null_rate: Share of null values
+    :type null_rate: float
+    :param repeat: Timed runs of each case
+    :type repeat: int
+    :param cases: Names of the cases to run, defaults to all
+    :type cases: list
+    :param connect: Connection factory, called as connect(server, database) after the table
+                    has been written with writeTable; defaults to sqliteConnect
+    :type connect: callable
+    :param seed: Random seed
+    :type seed: int
+    :return: meta data and, for each case, seconds, rows per second and peak traced memory
+    :rtype: dict
+    """
+    directory = tempfile.mkdtemp(prefix='pysql_benchmark_')
+    previous = pool.getPool()
+
+    try:
+        df = makeTable(rows, columns, segments, null_rate, seed)
+        writeTable(df, directory)
+
+        pool.setPool(pool.ConnectionPool(connect=connect or sqliteConnect(directory)))
+        catalog.getCatalog(SERVER, DATABASE).refresh()
+
+        results = {}
+        for name, (func, n) in _cases(df, segments).items():
+            if cases is not None and name not in cases:
+                continue
+
+            seconds, peak = _measure(func, repeat)
+            median = float(np.median(seconds))
+
+            results[name] = {'seconds': median,
+                             'min_seconds': min(seconds),
+                             'rows': n,
+                             'rows_per_sec': n / median if median > 0 else None,
+                             'peak_bytes': peak}
+    finally:
+        pool.setPool(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    meta = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'rows': rows,
+            'columns': columns,
+            'segments': segments,
+            'null_rate': null_rate,
+            'repeat': repeat}
+
+    return {'meta': meta, 'cases': results}
+
+
+def compare(baseline, current, threshold=0.2, memory_threshold=None):
+    """
+    Compares two benchmark results. A case regresses when its median time grows by more
+    than threshold (0.2 = 20%), or its peak memory by more than memory_threshold.
+
+    :param baseline: Results, or the path of a results file
+    :type baseline: dict
+    :param current: Results, or the path of a results file
+    :type current: dict
+    :param threshold: Allowed relative increase of the median time
+    :type threshold: float
+    :param memory_threshold: Allowed relative increase of peak memory, defaults to threshold
+    :type memory_threshold: float
+    :return: Case, baseline and current seconds and peak bytes, relative changes and Result (PASS / FAIL)
+    :rtype: pd.DataFrame
+    """
+    if memory_threshold is None:
+        memory_threshold = threshold
+
+    if isinstance(baseline, str):
+        with open(baseline) as f:
+            baseline = json.load(f)
+
+    if isinstance(current, str):
+        with open(current) as f:
+            current = json.load(f)
+
+    rows = []
+    for name, case in current['cases'].items():
+        base = baseline['cases'].get(name)
+
+        if base is None:
+            rows.append({'Case': name, 'Current s': case['seconds'], 'Current bytes': case['peak_bytes'],
+                         'Result': 'NEW'})
+            continue
+
+        time_change = case['seconds'] / base['seconds'] - 1 if base['seconds'] else 0.0
+        memory_change = case['peak_bytes'] / base['peak_bytes'] - 1 if base['peak_bytes'] else 0.0
+        failed = time_change > threshold or memory_change > memory_threshold
+
+        rows.append({'Case': name,
+                     'Baseline s': base['seconds'],
+                     'Current s': case['seconds'],
+                     'Time change': time_change,
+                     'Baseline bytes': base['peak_bytes'],
+                     'Current bytes': case['peak_bytes'],
+                     'Memory change': memory_change,
+                     'Result': 'FAIL' if failed else 'PASS'})
+
+    return pd.DataFrame(rows, columns=['Case', 'Baseline s', 'Current s', 'Time change',
+                                       'Baseline bytes', 'Current bytes', 'Memory change', 'Result'])
+
+
+def scaling(rows=100000, columns=300, processes=None, repeat=3, seed=0):
+    """
+    Times profiler.profileParallel on a wide synthetic table with a growing number of processes.
+
+    :param rows: Rows of the synthetic table
+    :type rows: int
+    :param columns: Columns of the synthetic table
+    :type columns: int
+    :param processes: Process counts to run, defaults to 1, 2, 4, ... up to the number of CPUs
+    :type processes: list
+    :param repeat: Timed runs of each process count
+    :type repeat: int
+    :param seed: Random seed
+    :type seed: int
+    :return: Processes, Seconds (median), and Speedup and Efficiency (speedup divided by the growth in processes)
+             over the first process count
+    :rtype: pd.DataFrame
+    """
+    if processes is None:
+        cpus = os.cpu_count() or 1
+        processes = sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)})
+
+    df = makeTable(rows, columns, seed=seed)
+
+    rows_list = []
+    for n in processes:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            profiler.profileParallel(df, processes=n)
+            seconds.append(time.perf_counter() - start)
+
+        rows_list.append({'Processes': n, 'Seconds': float(np.median(seconds))})
+
+    df = pd.DataFrame(rows_list, columns=['Processes', 'Seconds'])
+    df['Speedup'] = df['Seconds'].iloc[0] / df['Seconds']
+    df['Efficiency'] = df['Speedup'] * df['Processes'].iloc[0] / df['Processes']
+
+    return df
+
+
+def main(argv=None):
+    """
+    Command line: run writes results to a JSON file, compare exits with 1 on a regression,
+    scaling prints the speedup of parallel profiling.
+    """
+    parser = argparse.ArgumentParser(prog='python -m pysql.benchmark')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--rows', type=int, default=100000)
+    run_parser.add_argument('--columns', type=int, default=20)
+    run_parser.add_argument('--segments', type=int, default=100)
+    run_parser.add_argument('--null-rate', type=float, default=0.05)
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--case', action='append', dest='cases', help='case to run, may be repeated')
+    run_parser.add_argument('--output', default='benchmark.json')
+
+    compare_parser = commands.add_parser('compare', help='compare results with a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+    compare_parser.add_argument('--memory-threshold', type=float, default=None)
+
+    scaling_parser = commands.add_parser('scaling', help='time parallel profiling on 1 to N processes')
+    scaling_parser.add_argument('--rows', type=int, default=100000)
+    scaling_parser.add_argument('--columns', type=int, default=300)
+    scaling_parser.add_argument('--processes', type=int, nargs='+', default=None)
+    scaling_parser.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'scaling':
+        print(f"{os.cpu_count()} CPUs")
+        print(scaling(args.rows, args.columns, args.processes, args.repeat).to_string(index=False))
+
+        return 0
+
+    if args.command == 'run':
+        results = run(args.rows, args.columns, args.segments, args.null_rate, args.repeat, args.cases)
+
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        for name, case in results['cases'].items():
+            print(f"{name:40s} {case['seconds']:10.4f} s {case['peak_bytes'] / 2**20:10.1f} MB")
+
+        return 0
+
+    df = compare(args.baseline, args.current, args.threshold, args.memory_threshold)
+    print(df.to_string(index=False))
+
+    return 1 if (df['Result'] == 'FAIL').any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+cache.py
+====================================
+Query result cache
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import pandas as pd
+import pysql.checksum as checksum
+
+
+def normalizeQuery(query):
+    """
+    Collapses runs of whitespace outside string literals,
+    so queries which differ only in formatting share a cache entry.
+
+    :param query: SQL query
+    :type query: str
+    """
+    parts = re.split(r"('(?:[^']|'')*')", query.strip())
+
+    # odd parts are string literals
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part)
+                   for i, part in enumerate(parts))
+
+
+class QueryCache():
+    """
+    Disk cache of query results, keyed by (server, database, normalized query).
+    Entries expire after a TTL, the least recently used entries are evicted
+    once the cache grows past max_bytes, and entries which were stored with
+    a list of tables are invalidated when the checksum of any of those tables changes.
+
+    Results are stored as Feather files when pyarrow is installed, else as pickles.
+
+    :param directory: Cache directory
+    :type directory: str
+    :param max_bytes: Maximum size of the cached files
+    :type max_bytes: int
+    :param ttl: Default seconds an entry stays valid
+    :type ttl: float
+    """
+    def __init__(self, directory, max_bytes=2**30, ttl=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        try:
+            import pyarrow
+            self.format = 'feather'
+        except ImportError:
+            self.format = 'pickle'
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._index_file = os.path.join(directory, 'index.json')
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._index = {}
+        if os.path.exists(self._index_file):
+            with open(self._index_file) as f:
+                self._index = json.load(f)
+
+    def key(self, server, database, query, params=None):
+        """
+        Cache key of a query.
+        """
+        text = json.dumps([server.lower(), database.lower(), normalizeQuery(query),
+                           None if params is None else [repr(x) for x in params]])
+
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, server, database, query, params=None):
+        """
+        Returns the cached result of a query, or None.
+        """
+        key = self.key(server, database, query, params)
+
+        with self._lock:
+            entry = self._index.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if time.time() > entry['expires']:
+                self.expirations += 1
+                self.misses += 1
+                self._remove(key)
+                return None
+
+        # checksums are computed outside the lock, they query the server
+        for table, value in entry['checksums'].items():
+            if checksum.getChecksum(server, database, table) != value:
+                with self._lock:
+                    self.invalidations += 1
+                    self.misses += 1
+                    self._remove(key)
+                return None
+
+        try:
+            df = self._read(entry)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                self._remove(key)
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index[key]['accessed'] = time.time()
+                self._save()
+
+        return df
+
+    def put(self, server, database, query, df, params=None, ttl=None, tables=None):
+        """
+        Stores the result of a query.
+
+        :param ttl: Seconds the entry stays valid, defaults to the cache TTL
+        :type ttl: float
+        :param tables: Tables the query reads; the entry is invalidated when their checksum changes
+        :type tables: list
+        """
+        key = self.key(server, database, query, params)
+
+        checksums = {table: checksum.getChecksum(server, database, table)
+                     for table in (tables or [])}
+
+        path = os.path.join(self.directory, key)
+        fmt = self.format
+
+        try:
+            if fmt == 'feather':
+                df.to_feather(path)
+            else:
+                df.to_pickle(path)
+        except (ValueError, TypeError):
+            # feather needs a default index and string column names
+            fmt = 'pickle'
+            df.to_pickle(path)
+
+        size = os.path.getsize(path)
+        now = time.time()
+
+        with self._lock:
+            self._index[key] = {'file': key,
+                                'format': fmt,
+                                'bytes': size,
+                                'created': now,
+                                'accessed': now,
+                                'expires': now + (self.ttl if ttl is None else ttl),
+                                'checksums': checksums}
+            self._evict()
+            self._save()
+
+    def invalidate(self, server=None, database=None, query=None, params=None):
+        """
+        Removes one query's entry, or every entry if no query is given.
+        """
+        with self._lock:
+            if query is None:
+                keys = list(self._index)
+            else:
+                keys = [self.key(server, database, query, params)]
+
+            for key in keys:
+                if key in self._index:
+                    self.invalidations += 1
+                    self._remove(key)
+
+            self._save()
+
+    def stats(self):
+        """
+        Hit / miss statistics.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'expirations': self.expirations,
+                    'invalidations': self.invalidations,
+                    'evictions': self.evictions,
+                    'entries': len(self._index),
+                    'bytes': sum(x['bytes'] for x in self._index.values())}
+
+    def _read(self, entry):
+        path = os.path.join(self.directory, entry['file'])
+
+        if entry['format'] == 'feather':
+            return pd.read_feather(path)
+
+        return pd.read_pickle(path)
+
+    def _evict(self):
+        # least recently used first
+        total = sum(x['bytes'] for x in self._index.values())
+        lru = sorted(self._index, key=lambda k: self._index[k]['accessed'])
+
+        for key in lru:
+            if total <= self.max_bytes:
+                break
+
+            total -= self._index[key]['bytes']
+            self.evictions += 1
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._index.pop(key, None)
+
+        if entry is not None:
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
+
+    def _save(self):
+        tmp_file = self._index_file + f".{os.getpid()}.tmp"
+
+        with open(tmp_file, 'w') as f:
+            json.dump(self._index, f)
+
+        os.replace(tmp_file, self._index_file)
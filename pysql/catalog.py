@@ -0,0 +1,193 @@
+"""
+catalog.py
+====================================
+Cached schema catalog
+"""
+
+import time
+import threading
+import pandas as pd
+import pysql.io as io
+
+
+# SQL Server numeric data types
+NUMERIC_TYPES = ('bit', 'tinyint', 'smallint', 'int', 'bigint', 'decimal', 'numeric',
+                 'smallmoney', 'money', 'float', 'real')
+
+SCHEMA_COLUMNS = ['COLUMN_NAME', 'IS_NULLABLE', 'DATA_TYPE', 'CHARACTER_MAXIMUM_LENGTH',
+                  'NUMERIC_PRECISION', 'NUMERIC_SCALE']
+
+
+def splitTableName(table):
+    """
+    Splits a table name such as [dbo].[Sales] or db.dbo.Sales into (schema, table).
+    The schema is None if the name has none.
+
+    :param table: Table name
+    :type table: str
+    """
+    parts = [x.strip().strip('[]') for x in table.split('.')]
+
+    if len(parts) == 1:
+        return None, parts[0]
+
+    return parts[-2] or None, parts[-1]
+
+
+class SchemaCatalog():
+    """
+    Column metadata for every table and view in a database, loaded with one query
+    and answered from memory. The catalog reloads itself once it is older than ttl.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param ttl: Seconds before the catalog is reloaded
+    :type ttl: float
+    """
+    def __init__(self, server, database, ttl=600):
+        self.server = server
+        self.database = database
+        self.ttl = ttl
+        self.loaded = None
+
+        self._lock = threading.Lock()
+        # one reload at a time, so threads which find the catalog stale load it once
+        self._refresh_lock = threading.Lock()
+        self._tables = {}
+        self._names = {}
+
+    def refresh(self):
+        """
+        Reloads the catalog from INFORMATION_SCHEMA.COLUMNS.
+        """
+        with self._refresh_lock:
+            self._load()
+
+    def _stale(self):
+        return self.loaded is None or time.time() - self.loaded > self.ttl
+
+    def _load(self):
+        query = f"""
+                    SELECT      TABLE_SCHEMA,
+                                TABLE_NAME,
+                                COLUMN_NAME,
+                                IS_NULLABLE,
+                                DATA_TYPE,
+                                CHARACTER_MAXIMUM_LENGTH,
+                                NUMERIC_PRECISION,
+                                NUMERIC_SCALE
+                    FROM        INFORMATION_SCHEMA.COLUMNS
+                    WHERE       TABLE_CATALOG = DB_NAME()
+                    ORDER BY    TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+                """
+
+        df = io.executeQuery(self.server, self.database, query, cache=False)
+
+        tables = {}
+        names = {}
+        for (schema, table), table_df in df.groupby(['TABLE_SCHEMA', 'TABLE_NAME'], sort=False):
+            key = (schema.lower(), table.lower())
+            tables[key] = table_df[SCHEMA_COLUMNS].reset_index(drop=True)
+            names.setdefault(table.lower(), []).append(key)
+
+        with self._lock:
+            self._tables = tables
+            self._names = names
+            self.loaded = time.time()
+
+    def _lookup(self, table):
+        if self._stale():
+            with self._refresh_lock:
+                # another thread may have reloaded it while this one waited
+                if self._stale():
+                    self._load()
+
+        schema, name = splitTableName(table)
+
+        with self._lock:
+            if schema is not None:
+                return self._tables.get((schema.lower(), name.lower()))
+
+            # unqualified names resolve to dbo first, like SQL Server
+            keys = self._names.get(name.lower(), [])
+            keys = sorted(keys, key=lambda k: k[0] != 'dbo')
+
+            return self._tables[keys[0]] if keys else None
+
+    def hasTable(self, table):
+        """
+        True if the table or view exists.
+        """
+        return self._lookup(table) is not None
+
+    def getTableSchema(self, table):
+        """
+        Column name, nullability, data type, length, precision and scale of each column,
+        in ordinal order. Empty if the table does not exist.
+        """
+        schema_df = self._lookup(table)
+
+        if schema_df is None:
+            return pd.DataFrame(columns=SCHEMA_COLUMNS)
+
+        return schema_df.copy()
+
+    def getColumns(self, table):
+        """
+        Column names, in ordinal order.
+        """
+        schema_df = self._lookup(table)
+
+        return [] if schema_df is None else schema_df['COLUMN_NAME'].tolist()
+
+    def getColumnTypes(self, table):
+        """
+        Column name -> data type.
+        """
+        schema_df = self._lookup(table)
+
+        return {} if schema_df is None else dict(zip(schema_df['COLUMN_NAME'], schema_df['DATA_TYPE']))
+
+    def getNumericColumns(self, table, types=NUMERIC_TYPES):
+        """
+        Names of the columns with one of the given data types.
+        """
+        return [column for column, data_type in self.getColumnTypes(table).items()
+                if data_type.lower() in types]
+
+    def getNullableColumns(self, table):
+        """
+        Names of the nullable columns.
+        """
+        schema_df = self._lookup(table)
+
+        if schema_df is None:
+            return []
+
+        return schema_df.loc[schema_df['IS_NULLABLE'] == 'YES', 'COLUMN_NAME'].tolist()
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def getCatalog(server, database, ttl=600):
+    """
+    Returns the shared catalog of a database, creating it on first use.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param ttl: Seconds before the catalog is reloaded, for a new catalog
+    :type ttl: float
+    """
+    key = (server.lower(), database.lower())
+
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = SchemaCatalog(server, database, ttl)
+
+        return _catalogs[key]
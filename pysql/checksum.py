@@ -5,8 +5,8 @@ Checksum functions
 """
 
 import subprocess
-import pyodbc
-import pandas as pd
+import pysql.io as io
+import pysql.catalog as catalog
 
 
 def getChecksum(server, database, table):
@@ -26,19 +26,7 @@ def getChecksum(server, database, table):
 	"""
 
 	# get column names
-	query = f"""
-	        SELECT      COLUMN_NAME
-	        FROM        INFORMATION_SCHEMA.COLUMNS
-	        WHERE       TABLE_NAME = N'{table}'
-	    """
-
-
-
-	conn = pyodbc.connect('DRIVER={SQL Server};SERVER=' + server + ';DATABASE=' + database + ';Trusted_Connection=yes')
-	names_df = pd.io.sql.read_sql(query, conn)
-	conn.close()
-
-	names = names_df['COLUMN_NAME'].tolist()
+	names = catalog.getCatalog(server, database).getColumns(table)
 
 	# filter out refresh dates
 	column_names = ["[" + x + "]" for x in names if x not in ('DateCreated', 'DateRefreshed')]
@@ -61,4 +49,36 @@ def getChecksum(server, database, table):
 	except:
 		checksum = -1
 
-	return checksum
\ No newline at end of file
+	return checksum
+
+
+def getRangeChecksum(server, database, table, where, params=None):
+	"""
+	Retrieves the checksum of the rows of a table which match a filter.
+	Uses the connection pool, so the filter can take parameters.
+
+	:param server
+	:type database: string
+	:param database
+	:type database: string
+	:param table
+	:type table: string
+	:param where: Filter, e.g. "[RowVersion] <= ?"
+	:type where: string
+	:param params: Values for ? placeholders in the filter
+	:type params: list
+	:return: checksum (None for no rows)
+	:rtype: int
+	"""
+
+	names = catalog.getCatalog(server, database).getColumns(table)
+
+	# filter out refresh dates
+	column_names = ["[" + x + "]" for x in names if x not in ('DateCreated', 'DateRefreshed')]
+
+	query = f"SELECT CHECKSUM_AGG(CHECKSUM({','.join(column_names)})) AS checksum FROM {table} WHERE {where}"
+
+	# never from the query cache, the checksum detects changes
+	value = io.executeQuery(server, database, query, params=params, cache=False).iloc[0].tolist()[0]
+
+	return None if value is None or value != value else int(value)
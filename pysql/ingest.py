@@ -3,26 +3,60 @@
 # For data validation and QC in Pandas
 #####
 import hashlib
+import numpy as np
 import pandas as pd
 
 
-# Count nulls in each column
-def CountNullFrequency(df):
-  
-  # use a dictionary to load data into pandas
-  freq_dict = {}
+# Accept a DataFrame, or an iterable of DataFrame chunks (e.g. io.iterQuery)
+def iterChunks(df):
+  if isinstance(df, pd.DataFrame):
+    return [df]
+
+  return df
+
+
+# Total, null, blank string and non-null counts of every column, in one pass over each column
+# Blank strings are counted only with blanks=True
+def profileColumns(df, blanks=True):
+  columns = None
+  total_rows = 0
+
+  for chunk in iterChunks(df):
+    if columns is None:
+      columns = chunk.columns
+      null = np.zeros(len(columns), dtype=np.int64)
+      blank = np.zeros(len(columns), dtype=np.int64)
 
-  for column in df.columns:
-    # count frequencies
-    total = df[column].shape[0]
-    notnull = df[column].notnull().sum()
-    null = df[column].isna().sum()
+    rows = chunk.shape[0]
 
-    freq_dict.update( {column: [total, null, notnull]} )
+    # positional, so no column is copied and duplicate names are kept apart
+    for i in range(len(columns)):
+      values = chunk.iloc[:, i]
+      null[i] += rows - values.count()
 
+      # numbers and dates are never blank strings
+      if blanks and not (pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_datetime64_any_dtype(values.dtype)):
+        blank[i] += (values == '').sum()
+
+    total_rows += rows
+
+  if columns is None:
+    return pd.DataFrame(columns=['Column Name', 'Total Rows', 'Null', 'Blank', 'Not Null'])
+
+  return pd.DataFrame({ 'Column Name': columns,
+                        'Total Rows': np.full(len(columns), total_rows, dtype=np.int64),
+                        'Null': null,
+                        'Blank': blank,
+                        'Not Null': total_rows - null })
+
+
+# Count nulls in each column
+def CountNullFrequency(df):
+  profile_df = profileColumns(df, blanks=False)
 
-  # convert dictionary to dataframe
-  freq_df = pd.DataFrame(freq_dict)
+  # one column per column of df, rows are total, null, not null
+  freq_df = pd.DataFrame(profile_df[['Total Rows', 'Null', 'Not Null']].to_numpy().T,
+                         columns=profile_df['Column Name'].tolist())
   
   return freq_df
 
@@ -43,12 +77,12 @@ def locateDuplicates(df, column):
 
 
 def getTableDisposition(df):
-  count_arr = []
-  for column in df.columns:
-    blank_rows = df.loc[(df[column] == '') | (df[column].isna())].shape[0]
-    count_arr.append(blank_rows)
+  profile_df = profileColumns(df)
 
-  frame = { 'Column Name': df.columns, 'Total Rows': df.shape[0], 'Blank Rows': count_arr }
+  # blank rows are empty strings or nulls
+  frame = { 'Column Name': profile_df['Column Name'],
+            'Total Rows': profile_df['Total Rows'],
+            'Blank Rows': profile_df['Blank'] + profile_df['Null'] }
 
   return pd.DataFrame(frame) \
         .style.format({"Total Rows": "{:,.0f}",
@@ -66,38 +100,51 @@ def getFrequencyTable(df, column):
 
 
 def getSliceByBlanks(df, sliceColumn):
-  
+  others = [x for x in df.columns if x != sliceColumn]
+
+  # blank rows of each column, and those counted as frequency by getFrequencyTable,
+  # which counts the values of the second column
+  blank_df = pd.DataFrame({ x: (df[x] == '') | df[x].isna() for x in others }, index=df.index)
+  counted_df = blank_df & df[others[1]].notna().to_numpy()[:, None]
+
+  # one groupby over both masks
+  sums_df = pd.concat([blank_df, counted_df], axis=1, keys=['blank', 'counted']) \
+        .groupby(df[sliceColumn]).sum()
+
+  # slices without blank rows in a column have no frequency
+  freq_df = sums_df['counted'].where(sums_df['blank'] > 0)
+  freq_df = freq_df.rename_axis(sliceColumn).reset_index()
+
   out_df = df[sliceColumn].drop_duplicates()
-  
-  for column in df.columns:
-    if column == sliceColumn:
-      continue
-    
-    filter_df = df.loc[(df[column] == '') | df[column].isna()]
-    freq_df = getFrequencyTable(filter_df, sliceColumn)
-    freq_df = freq_df.rename(columns={"Frequency": column})
-  
-    out_df = pd.merge(out_df, freq_df, on=sliceColumn, how='outer')
-    out_df = out_df.fillna('')
+
+  # the first merge fills null slices with '', the second merge sorts them in
+  out_df = _mergeFrequencies(out_df, freq_df[[sliceColumn] + others[:1]], sliceColumn)
+  out_df = _mergeFrequencies(out_df, freq_df[[sliceColumn] + others[1:]], sliceColumn)
     
   return out_df
 
 
-def getFrequencyAcrossSlices(df, calcColumn, sliceColumn):
-  df_list = []
+def _mergeFrequencies(out_df, freq_df, sliceColumn):
+  out_df = pd.merge(out_df, freq_df, on=sliceColumn, how='outer')
 
-  slices = set(df[sliceColumn])
-  for sliceName in slices:
+  # counts found for every slice stay integers
+  for column in freq_df.columns[1:]:
+    if out_df[column].notna().all():
+      out_df[column] = out_df[column].astype('int64')
 
-    slice_df = df.loc[df[sliceColumn] == sliceName]
-    freq_df = slice_df[calcColumn].value_counts().reset_index()
-    freq_df = freq_df.rename(columns={calcColumn: "Frequency", "index": calcColumn})
-    freq_df[sliceColumn] = sliceName
+  return out_df.fillna('')
+
+
+def getFrequencyAcrossSlices(df, calcColumn, sliceColumn):
+  # every (slice, value) frequency in one groupby, nulls are not counted
+  freq_df = df.groupby([sliceColumn, calcColumn]).size().rename('Frequency').reset_index()
 
-    df_list.append(freq_df)
+  # index within each slice by descending frequency, as value_counts per slice gave
+  freq_df.index = freq_df.groupby(sliceColumn)['Frequency'] \
+        .rank(method='first', ascending=False).astype('int64').to_numpy() - 1
 
 
-  freq_disposition = pd.concat(df_list, sort=True).sort_values(by=[sliceColumn, calcColumn])
+  freq_disposition = freq_df[sorted(freq_df.columns)].sort_values(by=[sliceColumn, calcColumn])
   
   return freq_disposition
 
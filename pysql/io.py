@@ -5,33 +5,75 @@ SQL IO module
 """
 
 import os
+import re
 import time
+import errno
 import shutil
+import decimal
+import asyncio
+import weakref
+import tempfile
+import functools
+import threading
+import subprocess
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import pyodbc
 import sqlalchemy
+import pysql.pool as pool
+import pysql.catalog as catalog
+import pysql.metrics as metrics
+
+
+def connection(server, database):
+    """
+    Borrows a connection from the shared pool, for use in a with statement.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    """
+    return pool.getPool().connection(server, database)
 
 
 def getTableSchema(server, database, table):
-    query = f"""
-                SELECT      COLUMN_NAME,
-                            IS_NULLABLE,
-                            DATA_TYPE,
-                            CHARACTER_MAXIMUM_LENGTH
-                FROM        INFORMATION_SCHEMA.COLUMNS
-                WHERE       TABLE_NAME = N'{table}'
-            """
+    """
+    Column name, nullability, data type, length, precision and scale of each column
+    in a table, in ordinal order. Answered from the cached schema catalog.
 
-    df = executeQuery(server, database, query)
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param table: Table name, optionally schema qualified
+    :type table: str
+    """
+    return catalog.getCatalog(server, database).getTableSchema(table)
 
-    return df
 
 
+_query_cache = None
 
-def executeQuery(server_name, db_name, query):
+
+def setQueryCache(cache):
+    """
+    Sets the result cache used by executeQuery and executeQueryFromFile
+    when no cache is passed. None disables caching (the default).
+
+    :param cache: Result cache
+    :type cache: pysql.cache.QueryCache
+    """
+    global _query_cache
+    _query_cache = cache
+
+
+def executeQuery(server_name, db_name, query, params=None, cache=None, cache_tables=None):
     """
     Read table from SQL query, using Pyodbc.
+    Timings, rows and columns are reported to the metrics hooks, see pysql.metrics.
 
     :param server_name: Server name
     :type server_name: str
@@ -39,70 +81,709 @@ def executeQuery(server_name, db_name, query):
     :type db_name: str
     :param query: SQL query
     :type query: str
+    :param params: Values for ? placeholders in the query
+    :type params: list
+    :param cache: Result cache, defaults to the one set with setQueryCache; False disables it
+    :type cache: pysql.cache.QueryCache
+    :param cache_tables: Tables read by the query; the cached result is
+                         dropped when their checksum changes
+    :type cache_tables: list
     """
+    if cache is None:
+        cache = _query_cache
 
-    # Create the connection
-    conn = pyodbc.connect('DRIVER={SQL Server};SERVER=' + server_name + 
-                          ';DATABASE=' + db_name + ';Trusted_Connection=yes')
+    start = time.perf_counter()
 
-    # Read in query
-    start = time.time()
-    input_df = pd.io.sql.read_sql(query, conn)
-    end = time.time()
+    if cache:
+        input_df = cache.get(server_name, db_name, query, params)
+        if input_df is not None:
+            _emitRead('executeQuery', server_name, db_name, query, input_df, start, cached=True)
+            return input_df
 
-    # Print descriptive statistics
-    print("\nRead time :\t", int(end-start), "s")
-    rows = input_df.shape[0]
-    cols = input_df.shape[1]
+    # Read in query
+    with connection(server_name, db_name) as conn:
+        connected = time.perf_counter()
+        input_df, timings = _readQuery(conn, query, params)
 
-    print(f"Rows : \t\t {rows:,d}")
-    print(f"Columns : \t {cols:,d}")
+    if cache:
+        cache.put(server_name, db_name, query, input_df, params=params, tables=cache_tables)
 
-    # Close connection
-    conn.close()
+    _emitRead('executeQuery', server_name, db_name, query, input_df, start,
+              connect=connected - start, **timings)
 
     return input_df
 
 
+def _readQuery(conn, query, params=None):
+    """
+    Executes a query on an open connection and builds a DataFrame the way read_sql does,
+    timing the execute, fetch and convert phases separately.
+    """
+    cursor = conn.cursor()
+
+    try:
+        start = time.perf_counter()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        executed = time.perf_counter()
+
+        columns = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
+        fetched = time.perf_counter()
+    finally:
+        cursor.close()
+
+    df = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns,
+                                   coerce_float=True)
+    converted = time.perf_counter()
+
+    return df, {'execute': executed - start,
+                'fetch': fetched - executed,
+                'convert': converted - fetched}
+
+
+def _emitRead(function, server_name, db_name, query, df, start, connect=np.nan, execute=np.nan,
+              fetch=np.nan, convert=np.nan, cached=False, **extra):
+    # a no-op unless a metrics hook is registered
+    if not metrics.enabled():
+        return
+
+    event = {'function': function,
+             'fingerprint': metrics.fingerprint(query),
+             'server': server_name,
+             'database': db_name,
+             'connect': connect,
+             'execute': execute,
+             'fetch': fetch,
+             'convert': convert,
+             'total': time.perf_counter() - start,
+             'rows': df.shape[0],
+             'columns': df.shape[1],
+             'bytes': metrics.frameBytes(df),
+             'cached': cached}
+
+    # extra keys, e.g. totals over chunks, override those taken from df
+    event.update(extra)
+
+    metrics.emit(event)
+
+
+
+def executeBatch(server_name, db_name, query):
+    """
+    Executes a batch of statements in one round-trip, and reads every result set.
 
-def executeQueryFromFile(server, database, file_name):
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL batch, e.g. several SELECT statements separated by ;
+    :type query: str
+    :return: one DataFrame per result set
+    :rtype: list
     """
-    Excutes a query from a file.
+    start = time.perf_counter()
+
+    with connection(server_name, db_name) as conn:
+        connected = time.perf_counter()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("SET NOCOUNT ON;\n" + query)
+            executed = time.perf_counter()
+
+            frames = []
+            fetch = 0
+            convert = 0
+            while True:
+                # statements without a result set have no description
+                if cursor.description is not None:
+                    t = time.perf_counter()
+                    columns = [col[0] for col in cursor.description]
+                    rows = cursor.fetchall()
+                    fetch += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    frames.append(pd.DataFrame.from_records([tuple(row) for row in rows],
+                                                            columns=columns, coerce_float=True))
+                    convert += time.perf_counter() - t
+
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.close()
+
+    if metrics.enabled():
+        _emitRead('executeBatch', server_name, db_name, query, pd.DataFrame(), start,
+                  connect=connected - start, execute=executed - connected,
+                  fetch=fetch, convert=convert,
+                  rows=sum(df.shape[0] for df in frames),
+                  columns=sum(df.shape[1] for df in frames),
+                  bytes=sum(metrics.frameBytes(df) for df in frames),
+                  result_sets=len(frames))
+
+    return frames
+
+
+
+def probeQuery(server_name, db_name, query, params=None, rows=1):
+    """
+    Reads only the first rows of a query's result and cancels the rest,
+    e.g. to test whether a query returns any rows without transferring them all.
 
-    :param server: Server name
-    :type server: str
-    :param database: Database name
-    :type database: str
-    :param file_name: SQL file
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL query
     :type query: str
+    :param params: Values for ? placeholders in the query
+    :type params: list
+    :param rows: Rows to read
+    :type rows: int
     """
+    start = time.perf_counter()
 
-    # Create the connection
-    conn = pyodbc.connect('DRIVER={SQL Server};SERVER=' + server + ';DATABASE=' + database + ';Trusted_Connection=yes')
+    with connection(server_name, db_name) as conn:
+        connected = time.perf_counter()
+        cursor = conn.cursor()
 
-    # read query into string
-    with open(file_name) as file:
-        query = file.read()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            executed = time.perf_counter()
 
-    # Read in query
-    start = time.time()
-    df = pd.io.sql.read_sql(query, conn)
-    end = time.time()
+            # statements without a result set, e.g. SELECT INTO or UPDATE, have no description
+            while cursor.description is None:
+                if not cursor.nextset():
+                    raise ValueError("Query returned no result set")
 
-    # Close connection
-    conn.close()
+            columns = [col[0] for col in cursor.description]
+            records = cursor.fetchmany(rows)
+            fetched = time.perf_counter()
 
-    # Print descriptive statistics
-    print("\nRead time :\t", int(end-start), "s")
-    rows = df.shape[0]
-    cols = df.shape[1]
+            # stop the server from sending the rest of the result set
+            cursor.cancel()
+        finally:
+            cursor.close()
 
-    print(f"Rows : \t\t {rows:,d}")
-    print(f"Columns : \t {cols:,d}")
+    df = pd.DataFrame.from_records([tuple(row) for row in records], columns=columns,
+                                   coerce_float=True)
+
+    _emitRead('probeQuery', server_name, db_name, query, df, start,
+              connect=connected - start, execute=executed - connected,
+              fetch=fetched - executed, convert=time.perf_counter() - fetched)
 
     return df
 
 
+def countQuery(server_name, db_name, query, params=None, cap=None):
+    """
+    Counts the rows a query returns, on the server. With a cap, counting stops after
+    cap rows, so the count is at most cap.
+    The query is run as a derived table: every column needs a name, and ORDER BY needs TOP.
+
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL query
+    :type query: str
+    :param params: Values for ? placeholders in the query
+    :type params: list
+    :param cap: Rows to count at most
+    :type cap: int
+    """
+    top = "" if cap is None else f"TOP ({int(cap)}) "
+    query = query.strip().rstrip(';')
+
+    count_query = f"""SELECT  COUNT_BIG(*) AS n
+                      FROM    (SELECT {top}1 AS x FROM ({query}) AS q) AS c"""
+
+    df = executeQuery(server_name, db_name, count_query, params, cache=False)
+
+    return int(df.iloc[0, 0])
+
+
+
+_async_workers = 16
+_async_server_limit = 4
+_async_executor = None
+_async_lock = threading.Lock()
+
+# event loop -> {server: asyncio.Semaphore}
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def setAsyncLimits(workers=16, server_limit=4):
+    """
+    Sets the number of threads which run blocking queries for the async API,
+    and the number of queries each server may run at once.
+    Takes effect for event loops started afterwards.
+
+    :param workers: Threads shared by all servers
+    :type workers: int
+    :param server_limit: Concurrent queries per server
+    :type server_limit: int
+    """
+    global _async_workers, _async_server_limit, _async_executor
+
+    with _async_lock:
+        old, _async_executor = _async_executor, None
+        _async_workers = workers
+        _async_server_limit = server_limit
+        _async_semaphores.clear()
+
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def _asyncExecutor():
+    global _async_executor
+
+    with _async_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(max_workers=_async_workers)
+
+        return _async_executor
+
+
+async def runAsync(server, func, *args, **kwargs):
+    """
+    Runs a blocking pysql call on the shared executor, without blocking the event loop.
+    At most server_limit calls run against one server at a time.
+
+    :param server: Server the call queries, for the per-server limit
+    :type server: str
+    :param func: Blocking function
+    :type func: callable
+    """
+    loop = asyncio.get_running_loop()
+    semaphores = _async_semaphores.setdefault(loop, {})
+
+    if server not in semaphores:
+        semaphores[server] = asyncio.Semaphore(_async_server_limit)
+
+    async with semaphores[server]:
+        return await loop.run_in_executor(_asyncExecutor(),
+                                          functools.partial(func, *args, **kwargs))
+
+
+async def executeQueryAsync(server_name, db_name, query, params=None):
+    """
+    Read table from SQL query, as a coroutine. See executeQuery.
+
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL query
+    :type query: str
+    :param params: Values for ? placeholders in the query
+    :type params: list
+    """
+    return await runAsync(server_name, executeQuery, server_name, db_name, query, params)
+
+
+async def gatherQueries(queries, concurrency=8):
+    """
+    Runs many independent queries concurrently.
+    Returns their DataFrames in the order of the queries.
+
+    :param queries: (server, database, query) tuples
+    :type queries: list
+    :param concurrency: Queries in flight at once, across all servers
+    :type concurrency: int
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(server_name, db_name, query):
+        async with limit:
+            return await executeQueryAsync(server_name, db_name, query)
+
+    return await asyncio.gather(*[run(*query) for query in queries])
+
+
+# pandas dtype for each python type reported in cursor.description,
+# so that every chunk of a result set gets the same dtypes
+_DESCRIPTION_DTYPES = {
+    int: 'Int64',
+    float: 'float64',
+    decimal.Decimal: 'float64',
+    bool: 'boolean',
+    datetime.datetime: 'datetime64[ns]',
+}
+
+# datetime64[ns] covers only these years; dates outside, e.g. the 9999-12-31 end-date sentinel,
+# are read as datetime64[us], which covers every datetime, and the column falls back to object
+_NS_MIN = np.datetime64('1677-09-22', 'us')
+_NS_MAX = np.datetime64('2262-04-11', 'us')
+
+
+class _ColumnarBuilder():
+    """
+    Builds a DataFrame column by column from cursor batches.
+    Each column is a typed NumPy array, preallocated and grown in place,
+    so the result set is never held as a list of row tuples.
+    NULLs are kept in boolean masks, giving nullable Int64/boolean columns.
+    Datetime columns are datetime64[ns] when every value fits, else objects;
+    with object_dates=True they are always objects.
+    """
+    def __init__(self, description, capacity=10000, object_dates=False):
+        self.names = [col[0] for col in description]
+        self.object_dates = object_dates
+        self.dtypes = [_DESCRIPTION_DTYPES.get(col[1], 'object') for col in description]
+        self.rows = 0
+        self.capacity = max(capacity, 1)
+
+        self.values = []
+        self.masks = []
+        for dtype in self.dtypes:
+            self.values.append(np.empty(self.capacity, dtype=self._numpyDtype(dtype)))
+            self.masks.append(np.zeros(self.capacity, dtype=bool) if dtype in ('Int64', 'boolean') else None)
+
+    def _numpyDtype(self, dtype):
+        return {'Int64': np.int64, 'boolean': np.bool_, 'datetime64[ns]': 'datetime64[us]'}.get(dtype, dtype)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+
+        for arr in self.values + self.masks:
+            if arr is not None:
+                arr.resize(capacity, refcheck=False)
+
+        self.capacity = capacity
+
+    def append(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+
+        if self.rows + n > self.capacity:
+            self._grow(self.rows + n)
+
+        start, stop = self.rows, self.rows + n
+
+        for i, col in enumerate(zip(*rows)):
+            dtype = self.dtypes[i]
+
+            if self.masks[i] is not None:
+                mask = np.fromiter((v is None for v in col), dtype=bool, count=n)
+                self.masks[i][start:stop] = mask
+                if mask.any():
+                    col = [False if v is None else v for v in col]
+                self.values[i][start:stop] = np.fromiter(col, dtype=self.values[i].dtype, count=n)
+            elif dtype == 'object':
+                self.values[i][start:stop] = col
+            else:
+                # float64 and datetime64 convert None to NaN / NaT
+                self.values[i][start:stop] = np.array(col, dtype=self.values[i].dtype)
+
+        self.rows = stop
+
+    def toFrame(self):
+        n = self.rows
+        data = {}
+
+        for i, dtype in enumerate(self.dtypes):
+            self.values[i].resize(n, refcheck=False)
+
+            if dtype == 'Int64':
+                self.masks[i].resize(n, refcheck=False)
+                data[i] = pd.arrays.IntegerArray(self.values[i], self.masks[i])
+            elif dtype == 'boolean':
+                self.masks[i].resize(n, refcheck=False)
+                data[i] = pd.arrays.BooleanArray(self.values[i], self.masks[i])
+            elif dtype == 'datetime64[ns]':
+                data[i] = self._datetimes(self.values[i])
+            else:
+                data[i] = self.values[i]
+
+        df = pd.DataFrame(data, index=pd.RangeIndex(n), copy=False)
+        df.columns = self.names
+
+        return df
+
+    def _datetimes(self, values):
+        dates = values[~np.isnat(values)]
+
+        if self.object_dates or ((dates < _NS_MIN) | (dates > _NS_MAX)).any():
+            # as read_sql does, datetime objects rather than wrapped around dates
+            return pd.Series(values.astype(object), dtype=object)
+
+        return values.astype('datetime64[ns]')
+
+
+def iterQuery(server_name, db_name, query, chunk_rows=100000):
+    """
+    Read a SQL query in chunks, using Pyodbc.
+    Yields DataFrames of at most chunk_rows rows, with the same dtypes in every chunk,
+    so memory use is bounded by the chunk size rather than the result size.
+    Datetime columns are read as datetime objects: a date outside the datetime64[ns] range,
+    e.g. 9999-12-31, may only turn up in a later chunk.
+
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL query
+    :type query: str
+    :param chunk_rows: Rows per chunk
+    :type chunk_rows: int
+    """
+
+    start = time.perf_counter()
+
+    with connection(server_name, db_name) as conn:
+        connected = time.perf_counter()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(query)
+            executed = time.perf_counter()
+
+            chunks = 0
+            total_rows = 0
+            total_bytes = 0
+            fetch = 0
+            convert = 0
+            while True:
+                t = time.perf_counter()
+                rows = cursor.fetchmany(chunk_rows)
+                fetch += time.perf_counter() - t
+                if not rows:
+                    break
+
+                t = time.perf_counter()
+                chunks += 1
+                total_rows += len(rows)
+                builder = _ColumnarBuilder(cursor.description, len(rows), object_dates=True)
+                builder.append(rows)
+                chunk_df = builder.toFrame()
+                convert += time.perf_counter() - t
+
+                if metrics.enabled():
+                    total_bytes += metrics.frameBytes(chunk_df)
+
+                yield chunk_df
+
+            # an empty result still yields its columns
+            if chunks == 0:
+                chunk_df = _ColumnarBuilder(cursor.description, object_dates=True).toFrame()
+                yield chunk_df
+
+            _emitRead('iterQuery', server_name, db_name, query, chunk_df, start,
+                      connect=connected - start, execute=executed - connected,
+                      fetch=fetch, convert=convert,
+                      rows=total_rows, bytes=total_bytes, chunks=chunks)
+        finally:
+            cursor.close()
+
+
+def executeQueryColumnar(server_name, db_name, query, batch_rows=10000):
+    """
+    Read table from SQL query, filling typed NumPy arrays directly from the cursor.
+    Faster and lighter on memory than executeQuery for large, wide, numeric results.
+    Integer and bit columns are returned as nullable Int64 / boolean.
+
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param query: SQL query
+    :type query: str
+    :param batch_rows: Rows fetched per cursor.fetchmany call
+    :type batch_rows: int
+    """
+
+    start = time.perf_counter()
+
+    with connection(server_name, db_name) as conn:
+        connected = time.perf_counter()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(query)
+            executed = time.perf_counter()
+            builder = _ColumnarBuilder(cursor.description, batch_rows)
+
+            fetch = 0
+            convert = 0
+            while True:
+                t = time.perf_counter()
+                rows = cursor.fetchmany(batch_rows)
+                fetch += time.perf_counter() - t
+                if not rows:
+                    break
+
+                t = time.perf_counter()
+                builder.append(rows)
+                convert += time.perf_counter() - t
+        finally:
+            cursor.close()
+
+    t = time.perf_counter()
+    input_df = builder.toFrame()
+    convert += time.perf_counter() - t
+
+    _emitRead('executeQueryColumnar', server_name, db_name, query, input_df, start,
+              connect=connected - start, execute=executed - connected,
+              fetch=fetch, convert=convert)
+
+    return input_df
+
+
+def _partitionPredicates(server_name, db_name, table, partition_column, n_partitions, boundaries):
+    """
+    Splits the range of a key column into WHERE clauses, in key order.
+    Rows with a NULL key get their own partition, first.
+    """
+    column = f"[{partition_column}]"
+
+    if boundaries == 'range':
+        query = f"SELECT MIN({column}) AS lo, MAX({column}) AS hi FROM {table}"
+        with connection(server_name, db_name) as conn:
+            lo, hi = _readQuery(conn, query)[0].iloc[0].tolist()
+
+        if lo is None or pd.isna(lo):
+            return [(f"{column} IS NULL", [])]
+
+        # only numeric keys can be split evenly, others fall back to quantiles
+        if isinstance(lo, (bool, np.bool_)) or not isinstance(lo, (int, float, np.number)):
+            boundaries = 'quantile'
+        else:
+            edges = np.linspace(lo, hi, n_partitions + 1)[1:-1]
+            if isinstance(lo, (int, np.integer)):
+                edges = np.ceil(edges).astype(np.int64)
+            edges = sorted(set(edges.tolist()) - {lo})
+
+            predicates = [(f"{column} IS NULL", [])]
+            lower = None
+            for edge in edges:
+                if lower is None:
+                    predicates.append((f"{column} < ?", [edge]))
+                else:
+                    predicates.append((f"{column} >= ? AND {column} < ?", [lower, edge]))
+                lower = edge
+
+            if lower is None:
+                predicates.append((f"{column} IS NOT NULL", []))
+            else:
+                predicates.append((f"{column} >= ?", [lower]))
+
+            return predicates
+
+    if boundaries != 'quantile':
+        raise ValueError("boundaries must be 'range' or 'quantile'.")
+
+    # upper bound of each NTILE bucket
+    query = f"""
+                SELECT      MAX({column}) AS upper
+                FROM
+                (
+                            SELECT      {column},
+                                        NTILE({n_partitions}) OVER (ORDER BY {column}) AS tile
+                            FROM        {table}
+                            WHERE       {column} IS NOT NULL
+                ) AS A
+                GROUP BY    tile
+                ORDER BY    tile
+            """
+    with connection(server_name, db_name) as conn:
+        uppers = _readQuery(conn, query)[0]['upper'].drop_duplicates().tolist()
+
+    predicates = [(f"{column} IS NULL", [])]
+    lower = None
+    for upper in uppers:
+        if lower is None:
+            predicates.append((f"{column} <= ?", [upper]))
+        else:
+            predicates.append((f"{column} > ? AND {column} <= ?", [lower, upper]))
+        lower = upper
+
+    return predicates
+
+
+def _readPartition(server_name, db_name, query, params, retries, where):
+    attempt = 0
+
+    while True:
+        attempt += 1
+        start = time.perf_counter()
+
+        try:
+            with connection(server_name, db_name) as conn:
+                connected = time.perf_counter()
+                df, timings = _readQuery(conn, query, params)
+
+            _emitRead('readTableParallel', server_name, db_name, query, df, start,
+                      connect=connected - start, partition=where, attempts=attempt, **timings)
+
+            return df, time.perf_counter() - start, attempt
+        except Exception:
+            if attempt > retries:
+                raise
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+
+def readTableParallel(server_name, db_name, table, partition_column, n_partitions=8, workers=4,
+                      boundaries='range', retries=2, return_timings=False):
+    """
+    Read a table in key-range partitions, on a pool of threads with pooled connections.
+    Partitions are concatenated in key order; rows with a NULL key come first.
+    Each partition read is reported to the metrics hooks.
+
+    :param server_name: Server name
+    :type server_name: str
+    :param db_name: Database name
+    :type db_name: str
+    :param table: Table name
+    :type table: str
+    :param partition_column: Column used to split the table, ideally indexed
+    :type partition_column: str
+    :param n_partitions: Number of key ranges
+    :type n_partitions: int
+    :param workers: Number of concurrent queries
+    :type workers: int
+    :param boundaries: 'range' splits MIN..MAX evenly (numeric keys),
+                       'quantile' uses NTILE so partitions hold similar row counts
+    :type boundaries: str
+    :param retries: Retries per partition before the read fails
+    :type retries: int
+    :param return_timings: Also return the per-partition timings
+    :type return_timings: bool
+    """
+    predicates = _partitionPredicates(server_name, db_name, table, partition_column,
+                                      n_partitions, boundaries)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_readPartition, server_name, db_name,
+                                   f"SELECT * FROM {table} WHERE {where}", params, retries, where)
+                   for where, params in predicates]
+        results = [future.result() for future in futures]
+
+    # empty partitions, e.g. of NULL keys, have object columns which would make every column object
+    frames = [df for df, _, _ in results if df.shape[0] > 0] or [results[0][0]]
+    input_df = pd.concat(frames, ignore_index=True)
+
+    timings_df = pd.DataFrame({'Partition': [where for where, _ in predicates],
+                               'Bounds': [params for _, params in predicates],
+                               'Rows': [df.shape[0] for df, _, _ in results],
+                               'Seconds': [seconds for _, seconds, _ in results],
+                               'Attempts': [attempts for _, _, attempts in results]})
+
+    if return_timings:
+        return input_df, timings_df
+
+    return input_df
+
+
 def writeWithPandas(df, server, database, table, driver='SQL+Server', chunksize=200):
     """
     Wrapper for pd.to_sql()
@@ -142,36 +823,339 @@ def writeWithPandas(df, server, database, table, driver='SQL+Server', chunksize=
 
     return None
 
-def writeWithBCP(df, server, database, table):
+# pyodbc parameter types for SQL Server data types, used with fast_executemany
+_INPUT_TYPES = {
+    'bit': pyodbc.SQL_BIT,
+    'tinyint': pyodbc.SQL_TINYINT,
+    'smallint': pyodbc.SQL_SMALLINT,
+    'int': pyodbc.SQL_INTEGER,
+    'bigint': pyodbc.SQL_BIGINT,
+    'real': pyodbc.SQL_REAL,
+    'float': pyodbc.SQL_DOUBLE,
+    'decimal': pyodbc.SQL_DECIMAL,
+    'numeric': pyodbc.SQL_NUMERIC,
+    'money': pyodbc.SQL_DECIMAL,
+    'smallmoney': pyodbc.SQL_DECIMAL,
+    'date': pyodbc.SQL_TYPE_DATE,
+    'datetime': pyodbc.SQL_TYPE_TIMESTAMP,
+    'datetime2': pyodbc.SQL_TYPE_TIMESTAMP,
+    'smalldatetime': pyodbc.SQL_TYPE_TIMESTAMP,
+    'char': pyodbc.SQL_CHAR,
+    'varchar': pyodbc.SQL_VARCHAR,
+    'nchar': pyodbc.SQL_WCHAR,
+    'nvarchar': pyodbc.SQL_WVARCHAR,
+}
+
+
+def _inputSizes(schema_df):
     """
-    Writes a pandas dataframe to a SQL server instance, using the BCP utility.
+    setinputsizes() arguments and an estimate of the parameter buffer bytes per row.
+    """
+    sizes = []
+    row_bytes = 0
+
+    for _, col in schema_df.iterrows():
+        data_type = col['DATA_TYPE'].lower()
+        sql_type = _INPUT_TYPES.get(data_type)
+
+        if data_type in ('char', 'varchar', 'nchar', 'nvarchar'):
+            # (max) columns report a length of -1
+            length = col['CHARACTER_MAXIMUM_LENGTH']
+            length = 0 if pd.isna(length) or length < 0 else int(length)
+            sizes.append((sql_type, length, 0))
+            row_bytes += 2 * (length or 4000) + 8
+        elif data_type in ('decimal', 'numeric', 'money', 'smallmoney'):
+            # money is reported as precision 19 (smallmoney 10), scale 4
+            sizes.append((sql_type, int(col['NUMERIC_PRECISION']), int(col['NUMERIC_SCALE'])))
+            row_bytes += 48
+        elif data_type in ('datetime', 'datetime2', 'smalldatetime'):
+            # bound as datetime2(7), the server rounds to the column's precision;
+            # a smaller scale rejects values with more fractional digits
+            sizes.append((sql_type, 27, 7))
+            row_bytes += 24
+        elif sql_type is not None:
+            sizes.append((sql_type, 0, 0))
+            row_bytes += 24
+        else:
+            # let the driver describe the parameter
+            sizes.append(None)
+            row_bytes += 64
+
+    return sizes, row_bytes
+
+
+def writeWithExecutemany(df, server, database, table, mode='append', key_columns=None,
+                         memory_budget=64 * 2**20):
+    """
+    Writes a pandas dataframe to an existing SQL Server table, using pyodbc fast_executemany.
+    Parameter types come from the table schema, and rows are sent in batches sized
+    to fit memory_budget. Each batch is committed in its own transaction.
+
+    :param df: dataframe
+    :type df: pd.DataFrame
     :param server: Server name
     :type server: str
     :param database: Database name
     :type database: str
+    :param table: Table name
+    :type table: str
+    :param mode: 'append' inserts rows, 'replace' truncates the table first
+                 (in the first batch's transaction), 'upsert' merges on key_columns
+    :type mode: str
+    :param key_columns: Key columns, required for mode='upsert'
+    :type key_columns: list
+    :param memory_budget: Bytes of parameter buffer per batch
+    :type memory_budget: int
+    :return: rows written
+    :rtype: int
+    """
+    if mode not in ('append', 'replace', 'upsert'):
+        raise ValueError("mode must be 'append', 'replace' or 'upsert'.")
+
+    if mode == 'upsert' and not key_columns:
+        raise ValueError("key_columns are required for mode='upsert'.")
+
+    schema_df = getTableSchema(server, database, table)
+    schema_df = schema_df.set_index('COLUMN_NAME', drop=False)
+
+    missing = [x for x in df.columns if x not in schema_df.index]
+    if missing:
+        raise ValueError(f"Columns not in {table}: {missing}")
+
+    columns = df.columns.tolist()
+    sizes, row_bytes = _inputSizes(schema_df.loc[columns])
+    batch_rows = int(min(max(memory_budget // row_bytes, 1), 100000))
+
+    column_list = ", ".join(f"[{x}]" for x in columns)
+    placeholders = ", ".join("?" for _ in columns)
+
+    if mode == 'upsert':
+        target = "#pysql_stage"
+        on = " AND ".join(f"T.[{x}] = S.[{x}]" for x in key_columns)
+        update = ", ".join(f"T.[{x}] = S.[{x}]" for x in columns if x not in key_columns)
+        merge = f"""
+                MERGE       {table} AS T
+                USING       {target} AS S
+                ON          {on}
+                {f"WHEN MATCHED THEN UPDATE SET {update}" if update else ""}
+                WHEN NOT MATCHED THEN
+                    INSERT ({column_list})
+                    VALUES ({", ".join(f"S.[{x}]" for x in columns)});
+            """
+    else:
+        target = table
+
+    insert = f"INSERT INTO {target} ({column_list}) VALUES ({placeholders})"
+
+    start = time.time()
+    written = 0
+
+    with connection(server, database) as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+
+        try:
+            if mode == 'upsert':
+                cursor.execute(f"SELECT TOP 0 {column_list} INTO {target} FROM {table}")
+                conn.commit()
+
+            for i in range(0, max(df.shape[0], 1), batch_rows):
+                batch = df.iloc[i:i + batch_rows]
+                rows = batch.astype(object).where(batch.notna(), None).values.tolist()
+
+                try:
+                    if mode == 'replace' and i == 0:
+                        cursor.execute(f"TRUNCATE TABLE {table}")
+
+                    if rows:
+                        cursor.setinputsizes(sizes)
+                        cursor.executemany(insert, rows)
+
+                    if mode == 'upsert':
+                        cursor.execute(merge)
+                        cursor.execute(f"TRUNCATE TABLE {target}")
+
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+                written += len(rows)
+        finally:
+            if mode == 'upsert':
+                cursor.execute(f"IF OBJECT_ID('tempdb..{target}') IS NOT NULL DROP TABLE {target}")
+                conn.commit()
+            cursor.close()
+
+    end = time.time()
+
+    # diagnostic timing
+    print("Write time :\t", int(end - start), " s")
+    print(f"Rows : \t\t {written:,d}")
+
+    return written
+
+
+def _openFifo(path, proc):
+    """
+    Opens a FIFO for writing once bcp has opened it for reading.
+    Returns None if bcp exits before it does.
+    """
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+            if proc.poll() is not None:
+                return None
+            time.sleep(0.01)
+            continue
+
+        os.set_blocking(fd, True)
+        return os.fdopen(fd, 'w', newline='')
+
+
+def _bcpPartition(df, partition, tmp_dir, cmd, options, chunk_rows, sep):
+    """
+    Streams one partition of a dataframe into a bcp process.
+    On POSIX the data goes through a FIFO, so it is never written to disk;
+    elsewhere it is written to a file in tmp_dir first.
+    """
+    data_file = os.path.join(tmp_dir, f"part{partition}.txt")
+    error_file = os.path.join(tmp_dir, f"part{partition}.err")
+    output_file = os.path.join(tmp_dir, f"part{partition}.out")
+    use_fifo = hasattr(os, 'mkfifo')
+
+    if use_fifo:
+        os.mkfifo(data_file)
+    else:
+        df.to_csv(data_file, index=False, header=False, sep=sep)
+
+    start = time.time()
+
+    # bcp output goes to a file, a full stdout pipe would block bcp
+    with open(output_file, 'w') as out:
+        proc = subprocess.Popen(cmd + [data_file] + options + ['-e', error_file],
+                                stdout=out, stderr=subprocess.STDOUT)
+
+        if use_fifo:
+            f = _openFifo(data_file, proc)
+            if f is not None:
+                try:
+                    with f:
+                        for i in range(0, df.shape[0], chunk_rows):
+                            df.iloc[i:i + chunk_rows].to_csv(f, index=False, header=False, sep=sep)
+                except BrokenPipeError:
+                    # bcp exited early, its output says why
+                    pass
+
+        returncode = proc.wait()
+
+    end = time.time()
+
+    with open(output_file) as out:
+        output = out.read()
+
+    copied = re.search(r"(\d+) rows copied", output)
+
+    errors = ''
+    if os.path.exists(error_file):
+        with open(error_file) as err:
+            errors = err.read()
+
+    return {'Partition': partition,
+            'Rows Sent': df.shape[0],
+            'Rows Copied': int(copied.group(1)) if copied else 0,
+            'Return Code': returncode,
+            'Seconds': end - start,
+            'Output': output.strip(),
+            'Errors': errors}
+
+
+def loadWithBCP(df, server, database, table, partitions=1, batch_size=100000, truncate=True,
+                error_file=None, chunk_rows=100000, sep='|', bcp='bcp'):
+    """
+    Loads a pandas dataframe into a SQL server table, streaming it into the BCP utility.
+    The frame can be split into partitions, loaded by concurrent bcp processes.
+    Temporary files live in a directory unique to the call.
+
     :param df: dataframe
     :type df: pd.DataFrame
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param table: Table name, in the dbo schema
+    :type table: str
+    :param partitions: Number of concurrent bcp processes
+    :type partitions: int
+    :param batch_size: Rows per bcp batch (-b); each batch is committed separately
+    :type batch_size: int
+    :param truncate: Truncate the table before loading
+    :type truncate: bool
+    :param error_file: File to collect rows rejected by bcp
+    :type error_file: str
+    :param chunk_rows: Rows encoded at a time
+    :type chunk_rows: int
+    :param sep: Field terminator
+    :type sep: str
+    :param bcp: bcp executable
+    :type bcp: str
+    :return: one row per partition, with rows sent / copied and the bcp return code
+    :rtype: pd.DataFrame
     """
-    # write dataframe to temp file
-    os.makedirs('tmp', exist_ok=True)
-    tmp_file = os.path.abspath("tmp/upload_file.txt")
-
 
     # truncate table on destination server
-    query = f"TRUNCATE TABLE {database}.dbo.{table}"
-    cmd = f"sqlcmd -S {server} -h -1 -Q \"{query}\""
-    os.system(cmd)
+    if truncate:
+        query = f"TRUNCATE TABLE {database}.dbo.{table}"
+        subprocess.run(['sqlcmd', '-S', server, '-h', '-1', '-Q', query], check=True)
 
-    # write df to temp file
-    df.to_csv(tmp_file, index=False, header=False, sep="|")
+    # bcp takes its options after the data file
+    cmd = [bcp, f"{database}.dbo.{table}", 'in']
+    options = ['-c', '-T', f"-t{sep}", '-S', server, '-b', str(batch_size)]
 
-    # upload temp file to destination server
-    cmd = f"bcp {database}.dbo.{table} in \"{tmp_file}\" -c -T -t\"|\" -S {server}"
-    os.system(cmd)
+    bounds = np.linspace(0, df.shape[0], max(partitions, 1) + 1).astype(int)
+    tmp_dir = tempfile.mkdtemp(prefix='pysql_bcp_')
+
+    start = time.time()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(partitions, 1)) as executor:
+            futures = [executor.submit(_bcpPartition, df.iloc[lo:hi], i, tmp_dir,
+                                       cmd, options, chunk_rows, sep)
+                       for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))]
+            results = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    end = time.time()
+
+    results_df = pd.DataFrame(results)
+
+    if error_file:
+        with open(error_file, 'w') as err:
+            err.write("".join(results_df['Errors']))
 
+    # diagnostic timing
+    print("Write time :\t", int(end - start), " s")
+    print(results_df[['Partition', 'Rows Sent', 'Rows Copied', 'Return Code', 'Seconds']]
+            .to_string(index=False))
+
+    return results_df.drop(columns=['Errors'])
 
-    # delete temp file
-    shutil.rmtree('tmp')
+
+def writeWithBCP(df, server, database, table):
+    """
+    Writes a pandas dataframe to a SQL server instance, using the BCP utility.
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param df: dataframe
+    :type df: pd.DataFrame
+    """
+    loadWithBCP(df, server, database, table)
 
     return None
 
@@ -213,30 +1197,10 @@ def readTableFromQuery(server_name, db_name, query):
     :type query: str
     """
 
-    # Create the connection
-    conn = pyodbc.connect('DRIVER={SQL Server};SERVER=' + server_name + 
-                          ';DATABASE=' + db_name + ';Trusted_Connection=yes')
-
-    # Read in query
-    start = time.time()
-    input_df = pd.io.sql.read_sql(query, conn)
-    end = time.time()
-
-    # Print descriptive statistics
-    print("\nRead time :\t", int(end-start), "s")
-    rows = input_df.shape[0]
-    cols = input_df.shape[1]
-
-    print(f"Rows : \t\t {rows:,d}")
-    print(f"Columns : \t {cols:,d}")
-
-    # Close connection
-    conn.close()
-
-    return input_df
+    return executeQuery(server_name, db_name, query)
 
 
-def executeQueryFromFile(server_name, db_name, file_name):
+def executeQueryFromFile(server_name, db_name, file_name, cache=None, cache_tables=None):
     """
     Excutes a query from a file.
 
@@ -246,32 +1210,17 @@ def executeQueryFromFile(server_name, db_name, file_name):
     :type db_name: str
     :param file_name: SQL file
     :type query: str
+    :param cache: Result cache, see executeQuery
+    :type cache: pysql.cache.QueryCache
+    :param cache_tables: Tables read by the query, see executeQuery
+    :type cache_tables: list
     """
 
-    # Create the connection
-    conn = pyodbc.connect('DRIVER={SQL Server};SERVER=' + server_name + ';DATABASE=' + db_name + ';Trusted_Connection=yes')
-
     # read query into string
     with open(file_name) as file:
         query = file.read()
 
-    # Read in query
-    start = time.time()
-    df = pd.io.sql.read_sql(query, conn)
-    end = time.time()
-
-    # Close connection
-    conn.close()
-
-    # Print descriptive statistics
-    print("\nRead time :\t", int(end-start), "s")
-    rows = df.shape[0]
-    cols = df.shape[1]
-
-    print(f"Rows : \t\t {rows:,d}")
-    print(f"Columns : \t {cols:,d}")
-
-    return df
+    return executeQuery(server_name, db_name, query, cache=cache, cache_tables=cache_tables)
 
 
 def writeDfToSql(server, database, table, df):
@@ -289,23 +1238,4 @@ def writeDfToSql(server, database, table, df):
         print("Write permitted only on KISTEST, KSISTAGING")
         return False
 
-    # write dataframe to temp file
-    os.makedirs('tmp', exist_ok=True)
-    tmp_file = os.path.abspath("tmp/" + randomWord(10) + ".txt")
-
-
-    # truncate table on destination server
-    query = f"TRUNCATE TABLE {database}.dbo.{table}"
-    cmd = f"sqlcmd -S {server} -h -1 -Q \"{query}\""
-    os.system(cmd)
-
-    # write df to temp file
-    df.to_csv(tmp_file, index=False, sep="|")
-
-    # upload temp file to destination server
-    cmd = f"bcp {database}.dbo.{table} in \"{tmp_file}\" -c -T -t\"|\" -S {server}"
-    os.system(cmd)
-
-
-    # delete temp file
-    shutil.rmtree('tmp')
+    loadWithBCP(df, server, database, table)
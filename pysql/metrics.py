@@ -0,0 +1,162 @@
+"""
+metrics.py
+====================================
+IO instrumentation
+"""
+
+import re
+import hashlib
+import threading
+import warnings
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+# timing phases of a query event, in seconds
+PHASES = ['connect', 'execute', 'fetch', 'convert', 'total']
+
+_hooks = []
+
+
+def addHook(hook):
+    """
+    Registers a function which is called with every IO event.
+
+    Events are dictionaries with the keys: function, fingerprint, server, database,
+    connect, execute, fetch, convert, total (seconds), rows, columns, bytes and cached.
+    readTableParallel events also carry the partition.
+
+    :param hook: Function taking one event
+    :type hook: callable
+    """
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def removeHook(hook):
+    """
+    Unregisters a hook.
+
+    :param hook: Function passed to addHook
+    :type hook: callable
+    """
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def enabled():
+    """
+    True if any hook is registered. Callers skip building events otherwise.
+    """
+    return bool(_hooks)
+
+
+def emit(event):
+    """
+    Passes an event to every hook. A failing hook is reported as a warning,
+    it never fails the query.
+
+    :param event: IO event
+    :type event: dict
+    """
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception as e:
+            warnings.warn(f"Metrics hook {hook!r} failed: {e!r}")
+
+
+def fingerprint(query):
+    """
+    Identifies queries which differ only in literals, comments and formatting.
+
+    :param query: SQL query
+    :type query: str
+    """
+    text = re.sub(r"--[^\n]*|/\*.*?\*/", " ", query, flags=re.S)
+    text = re.sub(r"N?'(?:[^']|'')*'", "?", text)
+    text = re.sub(r"\b\d+(\.\d+)?\b", "?", text)
+    text = " ".join(text.lower().split())
+
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+def frameBytes(df):
+    """
+    Approximate memory of a DataFrame, without inspecting object values.
+    """
+    return int(df.memory_usage(index=False, deep=False).sum())
+
+
+def printEvent(event):
+    """
+    Hook which prints the read time, rows and columns of each event.
+    """
+    print("\nRead time :\t", f"{event['total']:.3f}", "s (cached)" if event.get('cached') else "s")
+    print(f"Rows : \t\t {event['rows']:,d}")
+    print(f"Columns : \t {event['columns']:,d}")
+
+
+class MetricsCollector():
+    """
+    Hook which keeps IO events in memory and summarizes them.
+
+        collector = MetricsCollector()
+        metrics.addHook(collector)
+
+    :param max_events: Events kept; the oldest are dropped first
+    :type max_events: int
+    """
+    def __init__(self, max_events=100000):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def clear(self):
+        """
+        Drops all events.
+        """
+        with self._lock:
+            self._events.clear()
+
+    def events(self):
+        """
+        All events, one row per event.
+        """
+        with self._lock:
+            return pd.DataFrame(list(self._events))
+
+    def summary(self, percentiles=(50, 90, 99), by='fingerprint'):
+        """
+        Count, rows and bytes, and percentiles of each timing phase, per group of events.
+
+        :param percentiles: Percentiles to report
+        :type percentiles: tuple
+        :param by: Event key to group on
+        :type by: str
+        """
+        df = self.events()
+
+        if df.empty:
+            return pd.DataFrame()
+
+        rows = []
+        for key, group_df in df.groupby(by, sort=False):
+            row = {by: key,
+                   'count': group_df.shape[0],
+                   'rows': int(group_df['rows'].sum()),
+                   'bytes': int(group_df['bytes'].sum())}
+
+            for phase in PHASES:
+                values = group_df[phase].dropna().to_numpy(dtype=float)
+                for p in percentiles:
+                    row[f"{phase}_p{p}"] = np.percentile(values, p) if values.size else np.nan
+
+            rows.append(row)
+
+        return pd.DataFrame(rows).sort_values(by='total_p50' if 50 in percentiles else 'count',
+                                               ascending=False).reset_index(drop=True)
@@ -8,85 +8,129 @@ import numpy as np
 import pandas as pd
 import os
 import pysql.io as io
+import pysql.catalog as catalog
 import pysql.validate as validate
+import pysql.checksum as checksum
+import pysql.ingest as ingest
 
 
+# data types summed by SumValues
+SUM_TYPES = ('int', 'float', 'decimal')
+
 
 def NullEntries(server, database, table, pivot_column):
     """
     Pivots a table and verifies that each segment has no null entries.
+    Each column is 'TRUE' for segments which contain a null entry.
 
 
     Template query:
     ----------------------------------
     SELECT      {pivot_column},
                 CASE
-                    WHEN SUM({column}) > 0 THEN 'FAIL'
-                    ELSE 'PASS'
+                    WHEN COUNT(CASE WHEN {column} IS NULL THEN 1 END) > 0 THEN 'TRUE'
+                    ELSE 'FALSE'
                 END AS {column}
-    FROM
-    (
-                SELECT      {pivot-column},
-                            CASE
-                                WHEN {column} IS NULL THEN 1
-                                ELSE 0
-                            END AS {column}
-                FROM        {table}
-    )
+    FROM        {table}
     GROUP BY    {pivot_column}
     ----------------------------------
     """
 
     
-    schema_df = io.getTableSchema(server, database, table)
-    column_list = schema_df['COLUMN_NAME']
+    column_list = catalog.getCatalog(server, database).getColumns(table)
 
 
-    query = f"SELECT      [{pivot_column}],\n"
+    select_list = [f"[{pivot_column}]"]
 
-    for i, column in enumerate(column_list):
+    for column in column_list:
         if(column == pivot_column):
             continue
 
-        query += f"""
+        # COUNT([column]) is not allowed on text, ntext and image columns
+        select_list.append(f"""
                     CASE
-                        WHEN SUM([{column}]) > 0 THEN 'TRUE'
+                        WHEN COUNT(CASE WHEN [{column}] IS NULL THEN 1 END) > 0 THEN 'TRUE'
                         ELSE 'FALSE'
-                    END AS [{column}]"""
+                    END AS [{column}]""")
 
-        if(i+1 < len(column_list)):
-            query += ",\n"
 
+    query = f"""SELECT      {",".join(select_list)}
+                FROM        {table}
+                GROUP BY    [{pivot_column}]
+            """
 
-    query += f"""FROM
-                    (
-                        SELECT      [{pivot_column}],
-                """
 
-    for i, column in enumerate(column_list):
-        if(column == pivot_column):
-            continue
+    df = io.executeQuery(server, database, query)
+    
+    return df
 
-        query += f"""
-                    CASE
-                        WHEN [{column}] IS NULL THEN 1
-                        ELSE 0
-                    END AS [{column}]"""
 
-        if(i+1 < len(column_list)):
-            query += ",\n"
 
+def _nullCountsQuery(table, pivot_column, column_list):
+    select_list = [f"[{pivot_column}]", "COUNT(*) AS [__rows]"]
+    # COUNT([column]) is not allowed on text, ntext and image columns
+    select_list += [f"COUNT(CASE WHEN [{column}] IS NULL THEN 1 END) AS [{column}]"
+                    for column in column_list if column != pivot_column]
 
-    query += f"""
-                        FROM        {table}
-                    ) AS A
-                    GROUP BY    [{pivot_column}]
-                """
+    return f"""SELECT      {", ".join(select_list)}
+                FROM        {table}
+                GROUP BY    [{pivot_column}]"""
 
 
-    df = io.executeQuery(server, database, query)
-    
-    return df
+
+def NullCounts(server, database, tables, pivot_column):
+    """
+    Counts the null entries of every column in each segment of many tables,
+    in one batch and one round-trip.
+    Returns one row per table, segment and column.
+
+
+    Template query, one per table:
+    ----------------------------------
+    SELECT      {pivot_column},
+                COUNT(*) AS [__rows],
+                COUNT(CASE WHEN {column} IS NULL THEN 1 END) AS {column}
+    FROM        {table}
+    GROUP BY    {pivot_column}
+    ----------------------------------
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param tables: Table names, or a single table name
+    :type tables: list
+    :param pivot_column: Column which segments every table
+    :type pivot_column: str
+    :return: Table, Segment, Column, Rows (in the segment), Null Count
+    :rtype: pd.DataFrame
+    """
+    if isinstance(tables, str):
+        tables = [tables]
+
+    schema = catalog.getCatalog(server, database)
+
+    queries = []
+    for table in tables:
+        column_list = schema.getColumns(table)
+
+        if pivot_column not in column_list:
+            raise ValueError(f"{table} does not exist or has no column {pivot_column}")
+
+        queries.append(_nullCountsQuery(table, pivot_column, column_list))
+
+
+    frames = io.executeBatch(server, database, ";\n".join(queries))
+
+
+    long_list = []
+    for table, df in zip(tables, frames):
+        long_df = df.melt(id_vars=[pivot_column, '__rows'], var_name='Column', value_name='Null Count') \
+                    .rename(columns={pivot_column: 'Segment', '__rows': 'Rows'})
+        long_df.insert(0, 'Table', table)
+        long_list.append(long_df)
+
+    return pd.concat(long_list, ignore_index=True)[['Table', 'Segment', 'Column', 'Rows', 'Null Count']]
 
 
 
@@ -104,31 +148,212 @@ def SumValues(server, database, table, pivot_column):
     ----------------------------------
     """
 
-    schema_df = io.getTableSchema(server, database, table)
+    column_list = catalog.getCatalog(server, database) \
+                    .getNumericColumns(table, types=SUM_TYPES)
 
-    column_df = schema_df.loc[schema_df['DATA_TYPE'].isin(['int', 'float', 'decimal'])]
-    column_list = column_df['COLUMN_NAME']
 
+    query = _sumValuesQuery(table, pivot_column, column_list)
 
-    query = f"SELECT      [{pivot_column}],\n"
 
-    for i, column in enumerate(column_list):
-        if(column == pivot_column):
-            continue
+    df = io.executeQuery(server, database, query)
+    df = df.set_index(pivot_column)
+
+    return df
 
-        query += f"SUM(CAST([{column}] AS FLOAT)) AS [{column}]"
 
-        if(i+1 < len(column_list)):
-            query += ",\n"
+
+def _sumValuesQuery(table, pivot_column, column_list, where=None):
+    select_list = [f"[{pivot_column}]"]
+    select_list += [f"SUM(CAST([{column}] AS FLOAT)) AS [{column}]"
+                    for column in column_list if column != pivot_column]
+
+    query = "SELECT      " + ",\n".join(select_list) + f"\nFROM {table}\n"
+
+    if where:
+        query += f"WHERE {where}\n"
+
+    query += f"GROUP BY [{pivot_column}]\n"
+
+    return query
+
+
+
+def SumValuesIncremental(server, database, table, pivot_column, watermark_column, state_file,
+                         verify=True, return_refresh=False):
+    """
+    SumValues for append-mostly tables. The result is stored in state_file together
+    with the highest value of watermark_column (a rowversion, identity or date column).
+    Later runs aggregate only the rows beyond the stored watermark and add them
+    to the stored result.
+
+    A full refresh runs when there is no state, when the table's numeric columns
+    have changed, or, with verify=True, when the checksum of the rows up to the
+    stored watermark has changed (rows were updated or deleted).
+    Verifying checksums every row up to the watermark, so with the default
+    verify=True each run still scans the whole table; schedule runs with verify=False
+    in between verified runs to keep incremental runs to a scan of the new rows only.
+    Rows with a NULL watermark are never counted.
+    The result has the columns of SumValues, an integer watermark column included.
+    The watermark, sums and checksums are never read from the query cache.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param table: Table name
+    :type table: str
+    :param pivot_column: Column which segments the table
+    :type pivot_column: str
+    :param watermark_column: Ever increasing column, ideally indexed
+    :type watermark_column: str
+    :param state_file: File which keeps the result and watermark between runs
+    :type state_file: str
+    :param verify: Compare checksums of the already aggregated rows
+    :type verify: bool
+    :param return_refresh: Also return the refresh which ran, 'full' or 'incremental'
+    :type return_refresh: bool
+    """
+    column_list = catalog.getCatalog(server, database) \
+                    .getNumericColumns(table, types=SUM_TYPES)
+    column_list = [x for x in column_list if x != pivot_column]
+
+    state = pd.read_pickle(state_file) if os.path.exists(state_file) else None
+
+    watermark = f"[{watermark_column}]"
+    query = f"SELECT MAX({watermark}) AS watermark FROM {table}"
+    # never from the query cache, which would hide new and changed rows
+    high = io.executeQuery(server, database, query, cache=False).iloc[0].tolist()[0]
+
+    full = state is None \
+            or state['watermark'] is None \
+            or state['columns'] != column_list \
+            or (state['table'], state['pivot_column'], state['watermark_column']) \
+                != (table, pivot_column, watermark_column)
+
+    # the checksum covers the rows up to the watermark of the last verified run
+    if not full and verify and state['checksum_watermark'] is not None:
+        value = checksum.getRangeChecksum(server, database, table, f"{watermark} <= ?",
+                                          [state['checksum_watermark']])
+        full = value != state['checksum']
+
+    if high is None or pd.isna(high):
+        df = pd.DataFrame(columns=[pivot_column] + column_list).set_index(pivot_column).astype('float64')
+        high = None
+    elif full:
+        query = _sumValuesQuery(table, pivot_column, column_list, f"{watermark} <= ?")
+        df = io.executeQuery(server, database, query, params=[high], cache=False).set_index(pivot_column)
+    else:
+        query = _sumValuesQuery(table, pivot_column, column_list,
+                                f"{watermark} > ? AND {watermark} <= ?")
+        delta_df = io.executeQuery(server, database, query, params=[state['watermark'], high],
+                                   cache=False) \
+                    .set_index(pivot_column)
+
+        # no new rows: the empty delta has object columns, which add would spread to the result
+        if delta_df.empty:
+            df = state['result']
         else:
-            query += "\n"
+            # NaN + NaN stays NaN, as SUM over only nulls is NULL
+            df = state['result'].add(delta_df, fill_value=0)
 
-    query += f"""FROM {table}
-            GROUP BY [{pivot_column}]
-            """
+    state = {'table': table,
+             'pivot_column': pivot_column,
+             'watermark_column': watermark_column,
+             'columns': column_list,
+             'watermark': high,
+             'checksum': None if full else state['checksum'],
+             'checksum_watermark': None if full else state['checksum_watermark'],
+             'result': df}
 
+    if verify and high is not None:
+        state['checksum'] = checksum.getRangeChecksum(server, database, table,
+                                                      f"{watermark} <= ?", [high])
+        state['checksum_watermark'] = high
 
-    df = io.executeQuery(server, database, query)
-    df = df.set_index(pivot_column)
+    pd.to_pickle(state, state_file)
+
+    if return_refresh:
+        return df, 'full' if full else 'incremental'
+
+    return df
+
+
+
+def _nullCountsFrame(df, pivot_column):
+    counts = None
+
+    for chunk in ingest.iterChunks(df):
+        column_list = [x for x in chunk.columns if x != pivot_column]
+
+        # one groupby over the null matrix of the chunk
+        partial = chunk[column_list].isna() \
+                    .groupby(chunk[pivot_column], dropna=False).sum()
+
+        counts = partial if counts is None else counts.add(partial, fill_value=0)
+
+    return counts.astype('int64')
+
+
+
+def NullEntriesFrame(df, pivot_column):
+    """
+    NullEntries on a DataFrame held in memory, or on a stream of DataFrame chunks,
+    without querying the server. Same output as NullEntries.
+
+    :param df: Table, or an iterable of chunks such as io.iterQuery
+    :type df: pd.DataFrame
+    :param pivot_column: Column which segments the table
+    :type pivot_column: str
+    """
+    counts = _nullCountsFrame(df, pivot_column)
+
+    flags = pd.DataFrame(np.where(counts.to_numpy() > 0, 'TRUE', 'FALSE'),
+                         index=counts.index, columns=counts.columns)
+
+    return flags.rename_axis(pivot_column).reset_index()
+
+
+
+def SumValuesFrame(df, pivot_column, column_list=None, server=None, database=None, table=None):
+    """
+    SumValues on a DataFrame held in memory, or on a stream of DataFrame chunks,
+    without querying the server: the sum of each numeric column per segment,
+    NaN where a segment has only null entries.
+
+    Given the server, database and table the frame was read from, the columns summed
+    are those of SumValues, the int, float and decimal columns in the catalog.
+    Otherwise every numeric column is summed, including bigint, smallint, tinyint,
+    real and money columns which SumValues leaves out.
+
+    :param df: Table, or an iterable of chunks such as io.iterQuery
+    :type df: pd.DataFrame
+    :param pivot_column: Column which segments the table
+    :type pivot_column: str
+    :param column_list: Columns to sum, defaults to the columns summed by SumValues when
+                        the table is given, else to the numeric columns of the first chunk
+    :type column_list: list
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param table: Table name
+    :type table: str
+    """
+    if column_list is None and table is not None:
+        column_list = catalog.getCatalog(server, database) \
+                        .getNumericColumns(table, types=SUM_TYPES)
+        column_list = [x for x in column_list if x != pivot_column]
+
+    sums = None
+
+    for chunk in ingest.iterChunks(df):
+        if column_list is None:
+            column_list = [x for x in chunk.select_dtypes('number').columns if x != pivot_column]
+
+        partial = chunk[column_list].astype('float64') \
+                    .groupby(chunk[pivot_column], dropna=False).sum(min_count=1)
+
+        # NaN + NaN stays NaN, as SUM over only nulls is NULL
+        sums = partial if sums is None else sums.add(partial, fill_value=0)
 
-    return df
\ No newline at end of file
+    return sums.rename_axis(pivot_column)
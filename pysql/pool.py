@@ -0,0 +1,229 @@
+"""
+pool.py
+====================================
+Connection pooling
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+import pyodbc
+
+
+def connectionString(server, database):
+    """
+    ODBC connection string for a SQL Server instance, using Windows authentication.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    """
+    return 'DRIVER={SQL Server};SERVER=' + server + ';DATABASE=' + database + ';Trusted_Connection=yes'
+
+
+def connect(server, database):
+    """
+    Opens a new (unpooled) pyodbc connection.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    """
+    return pyodbc.connect(connectionString(server, database))
+
+
+class ConnectionPool():
+    """
+    Thread-safe pool of database connections, keyed by (server, database).
+
+    Connections are health checked when they are checked out, and closed
+    once they have been idle for longer than idle_timeout.
+
+    :param max_size: Maximum open connections per (server, database)
+    :type max_size: int
+    :param idle_timeout: Seconds an unused connection is kept open
+    :type idle_timeout: float
+    :param checkout_timeout: Seconds to wait for a free connection
+    :type checkout_timeout: float
+    :param connect: Connection factory, called as connect(server, database)
+    :type connect: callable
+    """
+    def __init__(self, max_size=8, idle_timeout=300, checkout_timeout=60, connect=connect):
+        if(max_size < 1):
+            raise ValueError('max_size must be at least 1.')
+
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.connect = connect
+
+        # key -> list of (connection, time returned), oldest first
+        self._idle = {}
+        # key -> number of open connections, idle or checked out
+        self._open = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, server, database):
+        """
+        Checks out a connection, opening a new one if none are idle.
+        Blocks while max_size connections are already checked out.
+        """
+        key = (server, database)
+        deadline = time.monotonic() + self.checkout_timeout
+        conn = None
+        stale = []
+
+        # evicted connections are no longer counted, they are closed even on a timeout
+        try:
+            with self._cond:
+                while True:
+                    stale += self._evictIdle()
+                    idle = self._idle.get(key)
+
+                    if idle:
+                        conn = idle.pop()[0]
+                        break
+
+                    if self._open.get(key, 0) < self.max_size:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if(remaining <= 0):
+                        raise TimeoutError(f'No free connection to {server}.{database} '
+                                           f'after {self.checkout_timeout} s')
+                    self._cond.wait(remaining)
+        finally:
+            self._close(stale)
+
+        if conn is not None:
+            if self._isHealthy(conn):
+                return conn
+            self._close([conn])
+
+        # the slot is already counted, open a connection to fill it
+        try:
+            return self.connect(server, database)
+        except Exception:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, server, database, conn):
+        """
+        Returns a connection to the pool. Open transactions are rolled back.
+        """
+        key = (server, database)
+
+        try:
+            conn.rollback()
+            broken = False
+        except Exception:
+            broken = True
+
+        with self._cond:
+            if broken:
+                self._open[key] -= 1
+            else:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if broken:
+            self._close([conn])
+
+    @contextmanager
+    def connection(self, server, database):
+        """
+        Context manager which checks out a connection and returns it on exit.
+        """
+        conn = self.acquire(server, database)
+        try:
+            yield conn
+        finally:
+            self.release(server, database, conn)
+
+    def closeAll(self):
+        """
+        Closes every idle connection. Checked out connections are unaffected.
+        """
+        with self._cond:
+            stale = []
+            for key, idle in self._idle.items():
+                stale += [conn for conn, _ in idle]
+                self._open[key] -= len(idle)
+            self._idle = {}
+            self._cond.notify_all()
+
+        self._close(stale)
+
+    def _evictIdle(self):
+        # caller holds the lock; returns the connections to close
+        now = time.monotonic()
+        stale = []
+
+        for key, idle in self._idle.items():
+            n = 0
+            while n < len(idle) and now - idle[n][1] > self.idle_timeout:
+                n += 1
+
+            if n:
+                stale += [conn for conn, _ in idle[:n]]
+                del idle[:n]
+                self._open[key] -= n
+
+        if stale:
+            self._cond.notify_all()
+
+        return stale
+
+    def _isHealthy(self, conn):
+        try:
+            conn.cursor().execute('SELECT 1').fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def getPool():
+    """
+    Returns the shared connection pool, creating it on first use.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+
+        return _pool
+
+
+def setPool(pool):
+    """
+    Replaces the shared connection pool, e.g. to change its size or
+    to use a different connection factory. Idle connections in the
+    previous pool are closed.
+
+    :param pool: New pool
+    :type pool: ConnectionPool
+    """
+    global _pool
+
+    with _pool_lock:
+        old, _pool = _pool, pool
+
+    if old is not None:
+        old.closeAll()
@@ -0,0 +1,672 @@
+"""
+profiler.py
+====================================
+Streaming column profiles with mergeable sketches
+"""
+
+import os
+import traceback
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+# nullable arrays sent to workers as their values and mask, FloatingArray is new in pandas 1.2
+_MASKED_ARRAYS = tuple(getattr(pd.arrays, x) for x in ('IntegerArray', 'FloatingArray', 'BooleanArray')
+                       if hasattr(pd.arrays, x))
+
+
+def stringValues(values):
+    """
+    String form of values, the same for a value in every chunk: pandas formats dates
+    and durations by the resolution of the whole chunk, so that 2020-01-01 is
+    '2020-01-01' in a chunk of midnights and '2020-01-01 00:00:00' next to a time.
+    Dates are written in ISO format to the resolution of the dtype, in UTC when
+    they have a time zone, durations as a number of the dtype's units.
+
+    :param values: Values
+    :type values: pd.Series
+    """
+    values = pd.Series(values, copy=False)
+
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        if getattr(values.dtype, 'tz', None) is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+
+        array = values.to_numpy()
+        unit = np.datetime_data(array.dtype)[0]
+
+        return pd.Series(np.datetime_as_string(array, unit=unit), index=values.index, dtype=object)
+
+    if pd.api.types.is_timedelta64_dtype(values.dtype):
+        return pd.Series(values.to_numpy().astype(str), index=values.index, dtype=object)
+
+    return values.astype(str)
+
+
+def hashValues(values):
+    """
+    64 bit hashes of values, by their string form (stringValues), so that a value
+    hashes the same in every chunk and every process.
+
+    :param values: Values
+    :type values: pd.Series
+    """
+    strings = stringValues(values)
+
+    return pd.util.hash_pandas_object(strings, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bitLength(x):
+    # bits needed to write each uint64, 0 for 0
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+
+    return n + (x > 0)
+
+
+class HyperLogLog():
+    """
+    Distinct count estimate in 2**precision bytes, with a relative error of about
+    1.04 / sqrt(2**precision), 0.8% at the default precision.
+
+    :param precision: Bits of the hash which select a register, 4 to 18
+    :type precision: int
+    """
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision must be between 4 and 18.')
+
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        """
+        Adds values, given by their 64 bit hashes.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        p = np.uint64(self.precision)
+
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        rest = hashes << p
+
+        # position of the first 1 bit after the register bits
+        rank = np.minimum(64 - _bitLength(rest) + 1, 64 - self.precision + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        """
+        Adds the values of another HyperLogLog of the same precision.
+        """
+        if other.precision != self.precision:
+            raise ValueError('HyperLogLogs of different precision cannot be merged.')
+
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """
+        Estimated number of distinct values.
+        """
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+
+        # linear counting is more accurate for small counts
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * np.log(m / zeros)
+
+        return int(round(estimate))
+
+
+class CountMinSketch():
+    """
+    Frequency estimates which never undercount, and overcount by at most
+    e / width of the total count with probability 1 - exp(-depth).
+
+    :param width: Counters per row
+    :type width: int
+    :param depth: Rows, each with its own hash
+    :type depth: int
+    """
+    def __init__(self, width=2048, depth=5):
+        self.width = width
+        self.depth = depth
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, hashes):
+        # one hash per row, from the two halves of the 64 bit hash
+        low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        high = (hashes >> np.uint64(32)).astype(np.int64) | 1
+        rows = np.arange(self.depth, dtype=np.int64)[:, None]
+
+        return (low[None, :] + rows * high[None, :]) % self.width
+
+    def add(self, hashes, counts=None):
+        """
+        Adds values, given by their 64 bit hashes, each counted once or counts times.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        counts = np.ones(hashes.size, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+        columns = self._columns(hashes)
+        for row in range(self.depth):
+            np.add.at(self.counts[row], columns[row], counts)
+
+    def query(self, hashes):
+        """
+        Estimated count of each value, given by their 64 bit hashes.
+        """
+        columns = self._columns(np.asarray(hashes, dtype=np.uint64))
+
+        return self.counts[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch of the same size.
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('CountMinSketches of different size cannot be merged.')
+
+        self.counts += other.counts
+
+
+class ColumnProfile():
+    """
+    Mergeable profile of one column: counts of rows, nulls, blank and whitespace strings,
+    minimum and maximum, a histogram of value lengths, a distinct count estimate
+    and the most frequent values.
+
+    :param precision: HyperLogLog precision
+    :type precision: int
+    :param width: Count-min sketch width
+    :type width: int
+    :param depth: Count-min sketch depth
+    :type depth: int
+    :param top_k: Most frequent values reported
+    :type top_k: int
+    :param max_length: Longest length with its own histogram bin, longer values share the last bin
+    :type max_length: int
+    """
+    def __init__(self, precision=14, width=2048, depth=5, top_k=10, max_length=256):
+        self.top_k = top_k
+        self.max_length = max_length
+
+        self.rows = 0
+        self.nulls = 0
+        self.blanks = 0
+        self.whitespace = 0
+        self.minimum = None
+        self.maximum = None
+        self.comparable = True
+        self.lengths = np.zeros(max_length + 2, dtype=np.int64)
+
+        self.distinct = HyperLogLog(precision)
+        self.frequency = CountMinSketch(width, depth)
+
+        # candidate frequent values: string form -> hash
+        self.candidates = {}
+
+    def update(self, values):
+        """
+        Adds a chunk of the column's values.
+
+        :param values: Values
+        :type values: pd.Series
+        """
+        values = pd.Series(values, copy=False)
+        rows = values.shape[0]
+
+        values = values.dropna()
+
+        self.rows += rows
+        self.nulls += rows - values.shape[0]
+
+        if values.shape[0] == 0:
+            return
+
+        self._updateRange(values)
+
+        strings = stringValues(values)
+
+        # numbers and dates are never blank strings
+        if not (pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_datetime64_any_dtype(values.dtype)):
+            self.blanks += int((values == '').sum())
+            self.whitespace += int(strings.str.fullmatch(r'\s*').sum())
+
+        lengths = np.minimum(strings.str.len().to_numpy(dtype=np.int64), self.max_length + 1)
+        self.lengths += np.bincount(lengths, minlength=self.lengths.size)
+
+        # each distinct value of the chunk is hashed and counted once
+        counts = strings.value_counts()
+        hashes = hashValues(counts.index)
+
+        self.distinct.add(hashes)
+        self.frequency.add(hashes, counts.to_numpy())
+
+        top = min(counts.shape[0], 4 * self.top_k)
+        self._updateCandidates(dict(zip(counts.index[:top], hashes[:top])))
+
+    def merge(self, other):
+        """
+        Adds another profile of the same column, e.g. of other chunks profiled by another worker.
+        """
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.blanks += other.blanks
+        self.whitespace += other.whitespace
+        self.lengths += other.lengths
+
+        self.distinct.merge(other.distinct)
+        self.frequency.merge(other.frequency)
+
+        if other.minimum is not None:
+            self._updateRange(pd.Series([other.minimum, other.maximum], dtype=object))
+        self.comparable = self.comparable and other.comparable
+
+        self._updateCandidates(other.candidates)
+
+    def topValues(self):
+        """
+        Most frequent values, by their string form, and their estimated counts.
+        """
+        if not self.candidates:
+            return []
+
+        names = list(self.candidates)
+        estimates = self.frequency.query(np.array(list(self.candidates.values()), dtype=np.uint64))
+        order = np.argsort(-estimates, kind='stable')[:self.top_k]
+
+        return [(names[i], int(estimates[i])) for i in order]
+
+    def lengthHistogram(self):
+        """
+        Number of values of each length; the last bin counts values longer than max_length.
+        """
+        index = [str(i) for i in range(self.max_length + 1)] + [f">{self.max_length}"]
+
+        histogram = pd.Series(self.lengths, index=index, name='Count')
+
+        return histogram[histogram > 0]
+
+    def _updateRange(self, values):
+        if not self.comparable:
+            return
+
+        try:
+            low, high = values.min(), values.max()
+
+            if self.minimum is not None:
+                low, high = min(low, self.minimum), max(high, self.maximum)
+        except TypeError:
+            # mixed types have no order
+            self.comparable = False
+            self.minimum = self.maximum = None
+            return
+
+        self.minimum, self.maximum = low, high
+
+    def _updateCandidates(self, candidates):
+        self.candidates.update(candidates)
+
+        # keep a pool larger than top_k, so values frequent over many chunks can rise
+        if len(self.candidates) > 4 * self.top_k:
+            names = list(self.candidates)
+            estimates = self.frequency.query(np.array(list(self.candidates.values()), dtype=np.uint64))
+            keep = np.argsort(-estimates, kind='stable')[:4 * self.top_k]
+            self.candidates = {names[i]: self.candidates[names[i]] for i in keep}
+
+
+class StreamingProfiler():
+    """
+    Profiles a table chunk by chunk, e.g. from io.iterQuery or pd.read_csv(chunksize=...),
+    in memory which does not grow with the number of rows. Profilers of different parts
+    of a table, e.g. from different workers, merge into the profile of the whole table.
+
+        profiler = StreamingProfiler()
+        for chunk in io.iterQuery(server, database, "SELECT * FROM Sales"):
+            profiler.update(chunk)
+        report_df = profiler.report()
+
+    Values are compared by their string form: the distinct count and frequent values
+    of 1 and 1.0 differ, so chunks should have the same dtypes.
+
+    :param precision: HyperLogLog precision, 2**precision bytes per column
+    :type precision: int
+    :param width: Count-min sketch width
+    :type width: int
+    :param depth: Count-min sketch depth
+    :type depth: int
+    :param top_k: Most frequent values reported per column
+    :type top_k: int
+    :param max_length: Longest length with its own histogram bin
+    :type max_length: int
+    """
+    def __init__(self, precision=14, width=2048, depth=5, top_k=10, max_length=256):
+        self.options = {'precision': precision,
+                        'width': width,
+                        'depth': depth,
+                        'top_k': top_k,
+                        'max_length': max_length}
+
+        # column name -> ColumnProfile, in the order columns were first seen
+        self.columns = {}
+
+    def update(self, chunk):
+        """
+        Adds a chunk of rows.
+
+        :param chunk: Rows
+        :type chunk: pd.DataFrame
+        """
+        for i, column in enumerate(chunk.columns):
+            if column not in self.columns:
+                self.columns[column] = ColumnProfile(**self.options)
+
+            self.columns[column].update(chunk.iloc[:, i])
+
+        return self
+
+    def merge(self, other):
+        """
+        Adds the profile of other rows of the same table.
+
+        :param other: Profiler with the same options
+        :type other: StreamingProfiler
+        """
+        if other.options != self.options:
+            raise ValueError('Profilers with different options cannot be merged.')
+
+        for column, profile in other.columns.items():
+            if column in self.columns:
+                self.columns[column].merge(profile)
+            else:
+                self.columns[column] = profile
+
+        return self
+
+    def report(self):
+        """
+        One row per column: Total Rows, Null, Blank, Whitespace (blank or only whitespace),
+        Not Null, Distinct (estimate), Min, Max, Min Length, Max Length, Mean Length
+        and Top Values ((value, estimated count) pairs).
+        Lengths past max_length count as max_length + 1.
+        """
+        rows = []
+        for column, profile in self.columns.items():
+            lengths = np.flatnonzero(profile.lengths)
+            counted = profile.lengths.sum()
+
+            rows.append({'Column Name': column,
+                         'Total Rows': profile.rows,
+                         'Null': profile.nulls,
+                         'Blank': profile.blanks,
+                         'Whitespace': profile.whitespace,
+                         'Not Null': profile.rows - profile.nulls,
+                         'Distinct': profile.distinct.estimate() if counted else 0,
+                         'Min': profile.minimum,
+                         'Max': profile.maximum,
+                         'Min Length': int(lengths[0]) if counted else None,
+                         'Max Length': int(lengths[-1]) if counted else None,
+                         'Mean Length': float(np.arange(profile.lengths.size) @ profile.lengths / counted)
+                                        if counted else None,
+                         'Top Values': profile.topValues()})
+
+        return pd.DataFrame(rows, columns=['Column Name', 'Total Rows', 'Null', 'Blank', 'Whitespace',
+                                           'Not Null', 'Distinct', 'Min', 'Max', 'Min Length',
+                                           'Max Length', 'Mean Length', 'Top Values'])
+
+
+def profileChunks(chunks, **options):
+    """
+    Profiles an iterable of DataFrame chunks, see StreamingProfiler.
+
+    :param chunks: e.g. io.iterQuery(...) or pd.read_csv(path, chunksize=100000)
+    :type chunks: iterable
+    """
+    profiler = StreamingProfiler(**options)
+
+    for chunk in chunks:
+        profiler.update(chunk)
+
+    return profiler
+
+
+def _shareBuffer(array, segments):
+    # Python 3.8+, imported here so the profilers work on older versions
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    segments.append(shm)
+
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[:] = array
+
+    return (shm.name, array.dtype.str, array.shape[0])
+
+
+def _attachBuffer(buffer, segments):
+    from multiprocessing import shared_memory
+
+    name, dtype, length = buffer
+
+    shm = shared_memory.SharedMemory(name=name)
+    segments.append(shm)
+
+    return np.ndarray((length,), np.dtype(dtype), buffer=shm.buf)
+
+
+def _shareArrow(values, segments):
+    # strings as an Arrow IPC stream, written straight into shared memory
+    import pyarrow as pa
+    from multiprocessing import shared_memory
+
+    batch = pa.record_batch([pa.array(values, type=pa.large_string(), from_pandas=True)], names=['values'])
+
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, batch.schema) as writer:
+        writer.write_batch(batch)
+    size = mock.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    segments.append(shm)
+
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), batch.schema) as writer:
+        writer.write_batch(batch)
+
+    return (shm.name, size)
+
+
+def _readArrow(buffer, segments):
+    import pyarrow as pa
+    from multiprocessing import shared_memory
+
+    name, size = buffer
+    shm = shared_memory.SharedMemory(name=name)
+    segments.append(shm)
+
+    with pa.ipc.open_stream(pa.py_buffer(shm.buf[:size])) as reader:
+        table = reader.read_all()
+
+    # the strings are copied out, no reference to the shared memory is kept
+    return table.column(0).to_pandas()
+
+
+def _shareColumn(values, segments):
+    # what a worker needs to rebuild the column: numpy columns are copied into shared memory,
+    # nullable numbers as their values and mask, strings as Arrow buffers; anything else is pickled
+    dtype = values.dtype
+
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+        return ('numpy', values.name, [_shareBuffer(values.to_numpy(), segments)], None)
+
+    if isinstance(values.array, _MASKED_ARRAYS):
+        data = values.array.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        mask = values.isna().to_numpy()
+
+        return ('masked', values.name, [_shareBuffer(data, segments), _shareBuffer(mask, segments)], dtype)
+
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+
+        if pa is not None:
+            try:
+                return ('arrow', values.name, [_shareArrow(values, segments)], None)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # e.g. strings which are not valid UTF-8
+                pass
+
+    return ('pickle', values.name, values, None)
+
+
+def _readColumn(spec, segments):
+    kind, name, buffers, dtype = spec
+
+    if kind == 'numpy':
+        return pd.Series(_attachBuffer(buffers[0], segments), name=name, copy=False)
+
+    if kind == 'masked':
+        data, mask = (_attachBuffer(x, segments) for x in buffers)
+        return pd.Series(dtype.construct_array_type()(data, mask), name=name, copy=False)
+
+    if kind == 'arrow':
+        return _readArrow(buffers[0], segments).rename(name)
+
+    return buffers
+
+
+def _closeSegments(segments):
+    for shm in segments:
+        try:
+            shm.close()
+        except BufferError:
+            # still referenced after a failure, unmapped when the worker exits
+            pass
+
+
+def _unlinkSegments(segments):
+    for shm in segments:
+        shm.close()
+        shm.unlink()
+
+
+def _profileValues(spec, segments, options, chunk_rows):
+    values = _readColumn(spec, segments)
+
+    rows = values.shape[0]
+    chunk_rows = chunk_rows or max(rows, 1)
+
+    profile = ColumnProfile(**options)
+    for start in range(0, max(rows, 1), chunk_rows):
+        profile.update(values.iloc[start:start + chunk_rows])
+
+    return profile
+
+
+def _profileColumn(spec, options, chunk_rows):
+    # runs in a worker process
+    segments = []
+
+    try:
+        return _profileValues(spec, segments, options, chunk_rows)
+    except BaseException as e:
+        # the failed frames reference the shared memory, which cannot be closed while they do
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        _closeSegments(segments)
+
+
+def profileParallel(df, processes=None, chunk_rows=None, **options):
+    """
+    Profiles the columns of a wide DataFrame on a pool of processes, see StreamingProfiler.
+    Columns are sent to the workers through shared memory rather than pickled:
+    numeric, date and nullable numeric columns as numpy buffers, string columns as
+    Arrow buffers when pyarrow is installed. Other columns, e.g. categoricals
+    or mixed objects, are pickled. At most two columns per process are
+    held in shared memory at a time.
+
+        if __name__ == '__main__':
+            report_df = profiler.profileParallel(df, processes=8).report()
+
+    Where processes are spawned (Windows, macOS) the calling script needs
+    the __main__ guard above.
+
+    :param df: Table
+    :type df: pd.DataFrame
+    :param processes: Worker processes, defaults to the number of CPUs; 1 profiles in this process.
+                      More than 1 needs Python 3.8 (multiprocessing.shared_memory)
+    :type processes: int
+    :param chunk_rows: Rows a worker profiles at a time, defaults to the whole column.
+                       Smaller chunks bound the memory of a worker; the frequent values
+                       are then merged across chunks as in StreamingProfiler
+    :type chunk_rows: int
+    :param options: StreamingProfiler options
+    :return: Profiler with a profile of each column
+    :rtype: StreamingProfiler
+    """
+    processes = processes or os.cpu_count() or 1
+    profiler = StreamingProfiler(**options)
+
+    if processes == 1 or df.shape[1] < 2:
+        chunk_rows = chunk_rows or max(df.shape[0], 1)
+        for start in range(0, max(df.shape[0], 1), chunk_rows):
+            profiler.update(df.iloc[start:start + chunk_rows])
+
+        return profiler
+
+    # strings are the slowest to profile, so they are started first
+    order = sorted(range(df.shape[1]), key=lambda i: pd.api.types.is_numeric_dtype(df.dtypes.iloc[i]))
+    profiles = {}
+
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=min(processes, df.shape[1]))
+
+    try:
+        while order or running:
+            while order and len(running) < 2 * processes:
+                i = order.pop(0)
+                segments = []
+
+                try:
+                    spec = _shareColumn(df.iloc[:, i], segments)
+                    future = executor.submit(_profileColumn, spec, profiler.options, chunk_rows)
+                except BaseException:
+                    _unlinkSegments(segments)
+                    raise
+
+                running[future] = (i, segments)
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                i, segments = running.pop(future)
+                _unlinkSegments(segments)
+                profiles[i] = future.result()
+    finally:
+        for future, (i, segments) in running.items():
+            future.cancel()
+        executor.shutdown(wait=True)
+
+        for i, segments in running.values():
+            _unlinkSegments(segments)
+
+    # merged in column order, duplicate names into one profile as in update
+    for i in range(df.shape[1]):
+        column = df.columns[i]
+
+        if column in profiler.columns:
+            profiler.columns[column].merge(profiles[i])
+        else:
+            profiler.columns[column] = profiles[i]
+
+    return profiler
+
@@ -0,0 +1,410 @@
+"""
+scheduler.py
+====================================
+Runs validation checks as a dependency graph
+"""
+
+import json
+import time
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# status of a check after a run
+STATUSES = ['PASS', 'FAIL', 'ERROR', 'TIMEOUT', 'SKIPPED', 'CANCELLED']
+
+# longest wait for a check to finish before looking for cancel() again
+_POLL_SECONDS = 0.1
+
+
+def checkPassed(result):
+    """
+    Default test of a check's result:
+    'FAIL' fails, a non-empty list fails (assertTablesExist returns the missing tables),
+    a DataFrame with a Result column fails if any row is 'FAIL' (CheckSuite, expectNoNullColumns),
+    a tuple is tested on its first element, where True means failed (expectGreaterThanZero).
+    Anything else, e.g. a pivot, passes.
+
+    :param result: Value returned by a check
+    """
+    if isinstance(result, tuple) and result:
+        if isinstance(result[0], bool):
+            return not result[0]
+        return checkPassed(result[0])
+
+    if isinstance(result, str):
+        return result != 'FAIL'
+
+    if isinstance(result, list):
+        return len(result) == 0
+
+    if isinstance(result, pd.DataFrame) and 'Result' in result.columns:
+        return not (result['Result'] == 'FAIL').any()
+
+    return True
+
+
+class Scheduler():
+    """
+    Runs checks concurrently on a worker pool, in the order given by their dependencies.
+    A check starts once all checks it depends on have passed, and is skipped if any of them
+    did not pass. At most server_limit checks run against one server at a time.
+
+        scheduler = Scheduler(workers=8)
+        scheduler.add('tables', unittest.assertTablesExist, args=(server, database, ['Sales']))
+        scheduler.add('nulls', validate.expectNoNullColumns, args=(server, database, 'Sales'),
+                      depends=['tables'])
+        results_df = scheduler.run()
+
+    Python threads cannot be killed: a check which times out or is cancelled is abandoned,
+    its worker keeps running until the call returns. A check which timed out keeps
+    its place in server_limit until then, as it is still querying the server.
+
+    :param workers: Checks run at once
+    :type workers: int
+    :param server_limit: Checks run at once against one server
+    :type server_limit: int
+    :param timeout: Default seconds a check may run
+    :type timeout: float
+    """
+    def __init__(self, workers=8, server_limit=4, timeout=None):
+        self.workers = workers
+        self.server_limit = server_limit
+        self.timeout = timeout
+
+        self.checks = {}
+        self.records = {}
+        self.started = None
+
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._starts = {}
+
+    def add(self, name, func, args=(), kwargs=None, server=None, depends=(), timeout=None,
+            passed=checkPassed):
+        """
+        Adds a check.
+
+        :param name: Unique name of the check
+        :type name: str
+        :param func: Check, e.g. unittest.expectEmptySet
+        :type func: callable
+        :param args: Positional arguments of func
+        :type args: tuple
+        :param kwargs: Keyword arguments of func
+        :type kwargs: dict
+        :param server: Server the check queries, defaults to the first argument
+                       when it is a string (the server in pysql checks)
+        :type server: str
+        :param depends: Names of the checks which must pass first
+        :type depends: list
+        :param timeout: Seconds the check may run, defaults to the scheduler's timeout
+        :type timeout: float
+        :param passed: Tests the check's result
+        :type passed: callable
+        """
+        if name in self.checks:
+            raise ValueError(f"Check {name} already exists")
+
+        if server is None and args and isinstance(args[0], str):
+            server = args[0]
+
+        self.checks[name] = {'func': func,
+                             'args': tuple(args),
+                             'kwargs': dict(kwargs or {}),
+                             'server': server,
+                             'depends': list(depends),
+                             'timeout': self.timeout if timeout is None else timeout,
+                             'passed': passed}
+
+        return name
+
+    def cancel(self):
+        """
+        Stops a run: checks which have not started are cancelled, running checks are abandoned.
+        Can be called from another thread or from a check.
+        """
+        self._cancelled.set()
+
+    def run(self, timeout=None):
+        """
+        Runs all checks.
+
+        :param timeout: Seconds the whole run may take
+        :type timeout: float
+        :return: Check, Server, Status, Seconds, Start, End (seconds since the run started),
+                 Worker, Error and Result of each check, in the order they were added
+        :rtype: pd.DataFrame
+        """
+        self._validate()
+        self._cancelled.clear()
+        self._starts = {}
+
+        self.started = time.perf_counter()
+        deadline = None if timeout is None else self.started + timeout
+
+        self.records = {name: {'Check': name,
+                               'Server': check['server'],
+                               'Status': None,
+                               'Seconds': None,
+                               'Start': None,
+                               'End': None,
+                               'Worker': None,
+                               'Error': None,
+                               'Result': None}
+                        for name, check in self.checks.items()}
+
+        waiting = list(self.checks)
+        running = {}
+        # timed out checks whose calls have not returned yet
+        abandoned = {}
+        server_running = {}
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pysql-check')
+
+        try:
+            while waiting or running:
+                now = time.perf_counter()
+
+                if self._cancelled.is_set() or (deadline is not None and now >= deadline):
+                    self._cancelRun(waiting, running)
+                    break
+
+                waiting = self._submitReady(executor, waiting, running, server_running)
+
+                if not running and not abandoned:
+                    continue
+
+                done, _ = wait(list(running) + list(abandoned), timeout=self._waitTime(running, deadline),
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in running:
+                        self._finish(running.pop(future), future, server_running)
+
+                self._releaseAbandoned(abandoned, server_running)
+                self._timeoutRunning(running, abandoned)
+        except KeyboardInterrupt:
+            self._cancelRun(waiting, running)
+            raise
+        finally:
+            executor.shutdown(wait=False)
+
+        return self.results()
+
+    def results(self):
+        """
+        Results of the last run.
+        """
+        return pd.DataFrame(list(self.records.values()),
+                            columns=['Check', 'Server', 'Status', 'Seconds', 'Start', 'End',
+                                     'Worker', 'Error', 'Result'])
+
+    def timeline(self):
+        """
+        Checks of the last run which started, ordered by start time.
+        """
+        df = self.results().drop(columns='Result')
+        df = df[df['Start'].notna()]
+
+        return df.sort_values(by='Start').reset_index(drop=True)
+
+    def criticalPath(self):
+        """
+        Chain of checks which determined the length of the last run: the check which ended last,
+        the dependency of it which ended last, and so on.
+        """
+        records = {name: x for name, x in self.records.items() if x['End'] is not None}
+
+        path = []
+        name = max(records, key=lambda x: records[x]['End']) if records else None
+
+        while name is not None:
+            path.append(name)
+            depends = [x for x in self.checks[name]['depends'] if x in records]
+            name = max(depends, key=lambda x: records[x]['End']) if depends else None
+
+        df = self.results().set_index('Check').loc[path[::-1]].reset_index()
+
+        return df.drop(columns='Result')
+
+    def writeTrace(self, path):
+        """
+        Writes the timeline of the last run in the Chrome trace event format,
+        for chrome://tracing or Perfetto.
+
+        :param path: Output JSON file
+        :type path: str
+        """
+        events = [{'name': row['Check'],
+                   'cat': str(row['Server']),
+                   'ph': 'X',
+                   'ts': row['Start'] * 1e6,
+                   'dur': (row['End'] - row['Start']) * 1e6 if pd.notna(row['End']) else 0,
+                   'pid': 1,
+                   'tid': row['Worker'],
+                   'args': {'status': row['Status'], 'error': row['Error']}}
+                  for _, row in self.timeline().iterrows()]
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+
+    def _validate(self):
+        for name, check in self.checks.items():
+            for dependency in check['depends']:
+                if dependency not in self.checks:
+                    raise ValueError(f"Check {name} depends on unknown check {dependency}")
+
+        # depth first search for cycles
+        state = {}
+
+        def visit(name, stack):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Checks depend on each other: {' -> '.join(stack + [name])}")
+
+            state[name] = 'visiting'
+            for dependency in self.checks[name]['depends']:
+                visit(dependency, stack + [name])
+            state[name] = 'done'
+
+        for name in self.checks:
+            visit(name, [])
+
+    def _submitReady(self, executor, waiting, running, server_running):
+        still_waiting = []
+
+        for name in waiting:
+            check = self.checks[name]
+            statuses = [self.records[x]['Status'] for x in check['depends']]
+
+            # skipped as soon as any dependency did not pass
+            if any(x is not None and x != 'PASS' for x in statuses):
+                failed = [x for x in check['depends'] if self.records[x]['Status'] not in (None, 'PASS')]
+                self.records[name]['Status'] = 'SKIPPED'
+                self.records[name]['Error'] = f"Depends on {', '.join(failed)}"
+                continue
+
+            server = check['server']
+            if any(x is None for x in statuses) \
+                    or len(running) >= self.workers \
+                    or (server is not None and server_running.get(server, 0) >= self.server_limit):
+                still_waiting.append(name)
+                continue
+
+            server_running[server] = server_running.get(server, 0) + 1
+            running[executor.submit(self._call, name)] = name
+
+        # a skipped check may have skipped checks after it in the list
+        if len(still_waiting) < len(waiting) and not running:
+            return self._submitReady(executor, still_waiting, running, server_running)
+
+        return still_waiting
+
+    def _call(self, name):
+        check = self.checks[name]
+        start = time.perf_counter()
+
+        with self._lock:
+            self._starts[name] = start
+
+        try:
+            result = check['func'](*check['args'], **check['kwargs'])
+            error = None
+        except Exception as e:
+            result = None
+            error = e
+
+        return start, time.perf_counter(), threading.current_thread().name, result, error
+
+    def _finish(self, name, future, server_running):
+        server_running[self.checks[name]['server']] -= 1
+        record = self.records[name]
+
+        start, end, worker, result, error = future.result()
+        record.update({'Start': start - self.started,
+                       'End': end - self.started,
+                       'Seconds': end - start,
+                       'Worker': worker,
+                       'Result': result})
+
+        if error is not None:
+            record['Status'] = 'ERROR'
+            record['Error'] = repr(error)
+            return
+
+        try:
+            record['Status'] = 'PASS' if self.checks[name]['passed'](result) else 'FAIL'
+        except Exception as e:
+            record['Status'] = 'ERROR'
+            record['Error'] = repr(e)
+
+    def _waitTime(self, running, deadline):
+        now = time.perf_counter()
+        times = [_POLL_SECONDS] if deadline is None else [_POLL_SECONDS, deadline - now]
+
+        with self._lock:
+            for name in running.values():
+                timeout = self.checks[name]['timeout']
+                if timeout is None:
+                    continue
+
+                if name in self._starts:
+                    times.append(self._starts[name] + timeout - now)
+                else:
+                    # queued behind an abandoned check, look again shortly
+                    times.append(0.1)
+
+        return max(min(times), 0)
+
+    def _releaseAbandoned(self, abandoned, server_running):
+        for future, name in list(abandoned.items()):
+            if future.done():
+                abandoned.pop(future)
+                server_running[self.checks[name]['server']] -= 1
+
+    def _timeoutRunning(self, running, abandoned):
+        now = time.perf_counter()
+
+        for future, name in list(running.items()):
+            timeout = self.checks[name]['timeout']
+
+            with self._lock:
+                start = self._starts.get(name)
+
+            if timeout is None or start is None or now - start < timeout:
+                continue
+
+            # abandoned, its worker runs on until the call returns and keeps its server slot
+            future.cancel()
+            running.pop(future)
+            abandoned[future] = name
+
+            self.records[name].update({'Status': 'TIMEOUT',
+                                       'Start': start - self.started,
+                                       'End': now - self.started,
+                                       'Seconds': now - start,
+                                       'Error': f"Timed out after {timeout} s"})
+
+    def _cancelRun(self, waiting, running):
+        now = time.perf_counter()
+
+        for name in waiting:
+            self.records[name]['Status'] = 'CANCELLED'
+
+        for future, name in running.items():
+            future.cancel()
+
+            with self._lock:
+                start = self._starts.get(name)
+
+            self.records[name]['Status'] = 'CANCELLED'
+            if start is not None:
+                self.records[name].update({'Start': start - self.started,
+                                           'End': now - self.started,
+                                           'Seconds': now - start})
+
+        waiting.clear()
+        running.clear()
@@ -4,67 +4,73 @@ unittest.py
 Unit test functions
 """
 
+import numbers
+import datetime
 import pandas as pd
-from pysql.io import executeQuery
+import pysql.catalog as catalog
+from pysql.io import executeQuery, executeQueryAsync, probeQuery, countQuery, runAsync, connection
 
-def expectEmptySet(server, database, query):
+def expectEmptySet(server, database, query, return_sample=False, sample_rows=10, count_cap=10000):
     """
-    Expect empty result set
+    Expect empty result set.
+    Only the first row is read; the rest of the result set is never transferred.
+
+    With return_sample=True, also returns up to sample_rows offending rows, and the
+    number of offending rows counted on the server up to count_cap, as (result, sample, count).
+    The count query runs the query as a derived table: every column needs a name.
     """
-    df = executeQuery(server, database, query)
+    df = probeQuery(server, database, query, rows=sample_rows if return_sample else 1)
 
-    if(df.shape[0] == 0):
-        return 'PASS'
-    else:
-        return 'FAIL'
+    result = _emptySetResult(df)
+
+    if not return_sample:
+        return result
+
+    # all offending rows are in the sample, no need to count
+    if df.shape[0] < sample_rows:
+        return result, df, df.shape[0]
+
+    return result, df, countQuery(server, database, query, cap=count_cap)
 
 
 def expectFullSet(server, database, query):
     """
-    Expect empty result set
+    Expect non-empty result set.
+    Only the first row is read; the rest of the result set is never transferred.
     """
-    df = executeQuery(server, database, query)
+    df = probeQuery(server, database, query)
 
-    if(df.shape[0] > 0):
-        return 'PASS'
-    else:
-        return 'FAIL'
+    return _fullSetResult(df)
 
 
-def expectColumnValues(server, database, table, column, expected_values):
+def expectColumnValues(server, database, table, column, expected_values, max_literals=1000):
     """
-    Expect column values.
+    Expect the distinct values of a column to be expected_values, compared as sets on the server.
+    Up to max_literals expected values are sent as a VALUES list, more are uploaded
+    to a temp table. Only the number of mismatched values is read back.
     """
-    query = f"""SELECT DISTINCT {column}
-    			FROM {table}
-    		"""
-
-    df = executeQuery(server, database, query)
-    values = df[df.columns[0]].tolist()
-
-    if(values == expected_values):
-    	return 'PASS'
+    if len(expected_values) <= max_literals:
+        df = executeQuery(server, database, _columnValuesQuery(table, column, expected_values))
+        mismatches = df.iloc[0, 0]
     else:
-    	return 'FAIL'
+        mismatches = _columnValuesTempTable(server, database, table, column, expected_values)
+
+    return 'PASS' if mismatches == 0 else 'FAIL'
 
 
 def assertTablesExist(server, database, table_list):
     """
-    List of tables exist in database.
+    List of tables exist in database. Returns the missing tables.
+    Tables are looked up in the schema catalog, which is reloaded once
+    if any table is missing, in case it was created since the catalog was loaded.
     """
-    query = f"""SELECT table_name
-            FROM INFORMATION_SCHEMA.TABLES
-            WHERE TABLE_CATALOG='{database}'
-            ORDER BY table_name
-        """
+    schema = catalog.getCatalog(server, database)
 
-    df = executeQuery(server, database, query)
-    db_tables = df['table_name'].tolist()
-    
-    db_tables = [x.lower().strip() for x in db_tables]
-    input_tables = [x.lower().strip() for x in table_list]
-    missing_tables = [x for x in input_tables if x not in db_tables]
+    missing_tables = _missingTables(schema, table_list)
 
+    if missing_tables:
+        schema.refresh()
+        missing_tables = _missingTables(schema, table_list)
 
     return missing_tables
 
@@ -73,13 +79,236 @@ def assertRecordsExist(server, database, table):
     """
     Table exists.
     """
-    query = f"""SELECT TOP 10 *
+    query = _recordsQuery(table)
+
+    df = probeQuery(server, database, query)
+
+    return _fullSetResult(df)
+
+
+async def expectEmptySetAsync(server, database, query, return_sample=False, sample_rows=10,
+                              count_cap=10000):
+    """
+    Expect empty result set, as a coroutine. See expectEmptySet.
+    """
+    return await runAsync(server, expectEmptySet, server, database, query,
+                          return_sample, sample_rows, count_cap)
+
+
+async def expectFullSetAsync(server, database, query):
+    """
+    Expect non-empty result set, as a coroutine.
+    """
+    df = await runAsync(server, probeQuery, server, database, query)
+
+    return _fullSetResult(df)
+
+
+async def expectColumnValuesAsync(server, database, table, column, expected_values):
+    """
+    Expect column values, as a coroutine. See expectColumnValues.
+    """
+    return await runAsync(server, expectColumnValues, server, database, table, column,
+                          expected_values)
+
+
+async def assertTablesExistAsync(server, database, table_list):
+    """
+    List of tables exist in database, as a coroutine.
+    """
+    return await runAsync(server, assertTablesExist, server, database, table_list)
+
+
+async def assertRecordsExistAsync(server, database, table):
+    """
+    Table has records, as a coroutine.
+    """
+    df = await runAsync(server, probeQuery, server, database, _recordsQuery(table))
+
+    return _fullSetResult(df)
+
+
+class CheckSuite():
+    """
+    Collects checks and runs them as one T-SQL batch, in one round-trip.
+    The result has one row per check: Check (name), Result (PASS / FAIL)
+    and Observed (rows returned, or for expectColumnValues the number of
+    mismatched values).
+
+        suite = CheckSuite(server, database)
+        suite.expectEmptySet("SELECT id FROM Sales WHERE amount < 0")
+        suite.assertRecordsExist("Sales")
+        df = suite.run()
+        html = alert.formatTable(df.to_html(index=False), 'red')
+
+    Queries are run as derived tables: every column needs a name, and ORDER BY
+    needs TOP. A check which fails to compile fails the whole batch.
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    """
+    def __init__(self, server, database):
+        self.server = server
+        self.database = database
+        self.checks = []
+
+    def expectEmptySet(self, query, name=None):
+        """
+        Expect empty result set.
+        """
+        return self._add(name or f"expectEmptySet {len(self.checks) + 1}",
+                         f"SELECT COUNT_BIG(*) FROM ({_subquery(query)}) AS q", "= 0")
+
+    def expectFullSet(self, query, name=None):
+        """
+        Expect non-empty result set.
+        """
+        return self._add(name or f"expectFullSet {len(self.checks) + 1}",
+                         f"SELECT COUNT_BIG(*) FROM ({_subquery(query)}) AS q", "> 0")
+
+    def expectColumnValues(self, table, column, expected_values, name=None):
+        """
+        Expect the distinct values of a column to be expected_values, compared as sets.
+        """
+        return self._add(name or f"expectColumnValues {table}.{column}",
+                         _columnValuesQuery(table, column, expected_values), "= 0")
+
+    def assertRecordsExist(self, table, name=None):
+        """
+        Table has records.
+        """
+        return self._add(name or f"assertRecordsExist {table}",
+                         f"SELECT COUNT_BIG(*) FROM (SELECT TOP 10 1 AS x FROM {table}) AS q", "> 0")
+
+    def compile(self):
+        """
+        The T-SQL batch of all checks.
+        """
+        if not self.checks:
+            raise ValueError("CheckSuite has no checks")
+
+        selects = [f"""SELECT      {i} AS [__order],
+                                {_sqlLiteral(name)} AS [Check],
+                                CASE WHEN o.n {condition} THEN 'PASS' ELSE 'FAIL' END AS [Result],
+                                o.n AS [Observed]
+                    FROM        (SELECT CAST(({observed}) AS BIGINT) AS n) AS o"""
+                   for i, (name, observed, condition) in enumerate(self.checks)]
+
+        return "\nUNION ALL\n".join(selects) + "\nORDER BY [__order]"
+
+    def run(self):
+        """
+        Runs all checks in one query.
+        """
+        df = executeQuery(self.server, self.database, self.compile())
+
+        return df.drop(columns='__order')
+
+    async def runAsync(self):
+        """
+        Runs all checks in one query, as a coroutine.
+        """
+        df = await executeQueryAsync(self.server, self.database, self.compile())
+
+        return df.drop(columns='__order')
+
+    def _add(self, name, observed, condition):
+        self.checks.append((name, observed, condition))
+
+        return self
+
+
+def _subquery(query):
+    return query.strip().rstrip(';')
+
+
+def _sqlLiteral(value):
+    if value is None or value is pd.NaT:
+        return "NULL"
+    if pd.api.types.is_bool(value):
+        return "1" if value else "0"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Number):
+        if pd.isna(value):
+            return "NULL"
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return f"'{value.isoformat(timespec='milliseconds')}'"
+    if isinstance(value, datetime.date):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, str):
+        return "N'" + value.replace("'", "''") + "'"
+
+    raise ValueError(f"Cannot write {value!r} as a SQL literal")
+
+
+def _columnValuesQuery(table, column, expected_values, expected=None):
+    # number of values missing from either side
+    values = f"SELECT DISTINCT {column} FROM {table}"
+
+    if expected is None:
+        if len(expected_values) == 0:
+            return f"SELECT COUNT_BIG(*) FROM ({values}) AS v"
+
+        expected = ", ".join(f"({_sqlLiteral(x)})" for x in expected_values)
+        expected = f"SELECT x FROM (VALUES {expected}) AS e(x)"
+
+    return f"""SELECT (SELECT COUNT_BIG(*) FROM ({values} EXCEPT {expected}) AS v)
+                    + (SELECT COUNT_BIG(*) FROM ({expected} EXCEPT {values}) AS v)"""
+
+
+def _columnValuesTempTable(server, database, table, column, expected_values):
+    with connection(server, database) as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("IF OBJECT_ID('tempdb..#pysql_expected') IS NOT NULL DROP TABLE #pysql_expected")
+
+            # the column's type; ISNULL makes it an expression, so an identity property is not copied
+            cursor.execute(f"SELECT TOP 0 ISNULL({column}, {column}) AS x INTO #pysql_expected FROM {table}")
+
+            cursor.fast_executemany = True
+            cursor.executemany("INSERT INTO #pysql_expected (x) VALUES (?)",
+                               [(x,) for x in expected_values])
+
+            cursor.execute(_columnValuesQuery(table, column, expected_values,
+                                              expected="SELECT x FROM #pysql_expected"))
+            mismatches = cursor.fetchone()[0]
+
+            # the connection goes back to the pool with its session
+            cursor.execute("DROP TABLE #pysql_expected")
+        finally:
+            cursor.close()
+
+    return mismatches
+
+
+def _recordsQuery(table):
+    return f"""SELECT TOP 10 *
                 FROM {table}
-            """ 
+            """
 
-    df = executeQuery(server, database, query)
 
+def _emptySetResult(df):
+    if(df.shape[0] == 0):
+        return 'PASS'
+    else:
+        return 'FAIL'
+
+
+def _fullSetResult(df):
     if(df.shape[0] > 0):
         return 'PASS'
     else:
-        return 'FAIL'
\ No newline at end of file
+        return 'FAIL'
+
+
+def _missingTables(schema, table_list):
+    input_tables = [x.lower().strip() for x in table_list]
+    missing_tables = [x for x in input_tables if not schema.hasTable(x)]
+
+
+    return missing_tables
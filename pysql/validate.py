@@ -6,7 +6,9 @@ Validations on a SQL query
 
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 import pysql.io as io
+import pysql.catalog as catalog
 
 
 
@@ -15,10 +17,7 @@ def expectNoNullEntries(server, database, table, column):
     Expect no null entries in a table.
     """
 
-    query = f"""SELECT  TOP 100 [{column}]
-                FROM    [{table}]
-                WHERE   [{column}] IS NULL
-    """
+    query = _nullEntriesQuery(table, column)
 
     df = io.executeQuery(server, database, query)
 
@@ -28,51 +27,214 @@ def expectNoNullEntries(server, database, table, column):
         return 'FAIL'
 
 
-def expectGreaterThanZero(df, mask):
+async def expectNoNullEntriesAsync(server, database, table, column):
     """
-    Expect each value in a matrix to be greater than zero
+    Expect no null entries in a table, as a coroutine.
     """
 
-    srs_list = []
+    df = await io.executeQueryAsync(server, database, _nullEntriesQuery(table, column))
+
+    if(df.shape[0] == 0):
+        return 'PASS'
+    else:
+        return 'FAIL'
 
-    # vectorize this
-    for key, val in mask.items():
-        srs = pd.Series(val).rename('Masked Column').to_frame().set_index('Masked Column')
-        srs[key] = True
-        srs_list.append(srs)
 
+def _nullEntriesQuery(table, column):
+    return f"""SELECT  TOP 100 [{column}]
+                FROM    [{table}]
+                WHERE   [{column}] IS NULL
+    """
 
-    masked_df = pd.concat(srs_list, axis=1).fillna(False).T
 
+def expectNoNullColumns(server, database, tables, columns=None, workers=1):
+    """
+    Expect no null entries in many columns, with one scan per table.
+    Returns the null count and PASS / FAIL of each column.
+    Raises ValueError if a table does not exist.
+
+
+    Template query, one per table:
+    ----------------------------------
+    SELECT      COUNT_BIG(CASE WHEN {column} IS NULL THEN 1 END) AS {column}
+    FROM        {table}
+    ----------------------------------
+
+    :param server: Server name
+    :type server: str
+    :param database: Database name
+    :type database: str
+    :param tables: Table names, or a single table name
+    :type tables: list
+    :param columns: Columns to check in every table, or table -> columns;
+                    defaults to the nullable columns of each table
+    :type columns: list
+    :param workers: Tables scanned at once
+    :type workers: int
+    :return: Table, Column, Null Count, Result
+    :rtype: pd.DataFrame
+    """
+    if isinstance(tables, str):
+        tables = [tables]
 
-    # window the pivot to the columns, indices in mask_df
-    col_list = masked_df.columns.tolist()
-    ix_list = masked_df.index
+    if len(tables) == 0:
+        return pd.DataFrame({'Table': pd.Series(dtype=object),
+                             'Column': pd.Series(dtype=object),
+                             'Null Count': pd.Series(dtype='int64'),
+                             'Result': pd.Series(dtype=object)})
 
-    windowed_df = df.loc[ix_list][col_list]
-    failed_df = ~(windowed_df > 0)
+    schema = catalog.getCatalog(server, database)
 
+    # a missing table would have no nullable columns, and pass with no rows
+    missing = [x for x in tables if not schema.hasTable(x)]
+    if missing:
+        # created since the catalog was read
+        schema.refresh()
+        missing = [x for x in missing if not schema.hasTable(x)]
 
-    # failed_df AND masked_df yields the cells which failed testing
-    test_df = np.logical_and(failed_df, masked_df)
-    test = test_df.sum().sum()
+    if missing:
+        raise ValueError(f"Tables do not exist: {', '.join(missing)}")
 
+    def check(table):
+        if isinstance(columns, dict):
+            column_list = columns.get(table)
+        else:
+            column_list = columns
 
-    # select only rows, columns with failed value
-    cols = test_df.sum()
-    rows = test_df.sum(axis=1)
+        if column_list is None:
+            column_list = schema.getNullableColumns(table)
 
-    failed_cols = cols[cols > 0].index.tolist()
-    failed_rows = rows[rows > 0].index.tolist()
+        if len(column_list) == 0:
+            return pd.DataFrame(columns=['Table', 'Column', 'Null Count', 'Result'])
 
+        df = io.executeQuery(server, database, _nullCountsQuery(table, column_list))
 
-    failed_df = test_df.loc[failed_rows][failed_cols].replace({True: 'FAIL', False: 'PASS'})
+        return pd.DataFrame({'Table': table,
+                             'Column': list(column_list),
+                             'Null Count': df.iloc[0].astype('int64').to_numpy()})
+
+    if workers > 1 and len(tables) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(check, tables))
+    else:
+        frames = [check(table) for table in tables]
+
+
+    df = pd.concat(frames, ignore_index=True)
+    df['Null Count'] = df['Null Count'].astype('int64')
+    df['Result'] = np.where(df['Null Count'] == 0, 'PASS', 'FAIL')
+
+    return df
+
+
+def _nullCountsQuery(table, column_list):
+    # COUNT_BIG([column]) is not allowed on text, ntext and image columns
+    select_list = [f"COUNT_BIG(CASE WHEN [{column}] IS NULL THEN 1 END) AS [{column}]" for column in column_list]
+
+    return f"""SELECT  {", ".join(select_list)}
+                FROM    {table}
+    """
+
+
+def expectGreaterThanZero(df, mask, sparse=None):
+    """
+    Expect each value in a matrix to be greater than zero.
+    Only the cells in mask are tested; null values fail.
+
+    The mask is held as a boolean matrix over the masked rows and columns, or,
+    when sparse, as the coordinates of the masked cells only, which avoids
+    windowing the pivot when the mask covers few of its cells.
+
+    :param df: Pivot, such as pivot.SumValues
+    :type df: pd.DataFrame
+    :param mask: Row -> columns of the row to test
+    :type mask: dict
+    :param sparse: Test only the masked cells, by default when under 10% of the window is masked
+    :type sparse: bool
+    :return: True if any test failed, and PASS / FAIL for the rows and columns with a failure
+    :rtype: tuple
+    """
 
+    rows, columns, mask_rows, mask_cols = _maskCoordinates(mask)
 
+    # positions in the pivot, raises KeyError for labels not in the pivot like .loc
+    row_ix = _positions(df.index, rows)
+    col_ix = _positions(df.columns, columns)
 
-    if(test == 0):
+    if sparse is None:
+        sparse = mask_rows.size < 0.1 * len(rows) * len(columns)
+
+
+    if sparse:
+        failed = _failedCells(df, row_ix[mask_rows], col_ix[mask_cols])
+        fail_rows, fail_cols = mask_rows[failed], mask_cols[failed]
+    else:
+        masked = np.zeros((len(rows), len(columns)), dtype=bool)
+        masked[mask_rows, mask_cols] = True
+
+        # failed AND masked yields the cells which failed testing
+        failed = ~(df.iloc[row_ix, col_ix] > 0).to_numpy()
+        fail_rows, fail_cols = np.nonzero(failed & masked)
+
+
+    # select only rows, columns with failed value
+    failed_rows = np.unique(fail_rows)
+    failed_cols = np.unique(fail_cols)
+
+    result = np.full((failed_rows.size, failed_cols.size), 'PASS', dtype=object)
+    result[np.searchsorted(failed_rows, fail_rows), np.searchsorted(failed_cols, fail_cols)] = 'FAIL'
+
+    failed_df = pd.DataFrame(result,
+                             index=pd.Index(rows)[failed_rows],
+                             columns=pd.Index(columns)[failed_cols],
+                             dtype=object)
+
+
+
+    if(fail_rows.size == 0):
         print("Tests passed")
         return False, failed_df
     else:
         print("Tests failed")
-        return True, failed_df
\ No newline at end of file
+        return True, failed_df
+
+
+def _maskCoordinates(mask):
+    # masked rows and columns in order of appearance, and the (row, column) of each masked cell
+    rows = list(mask)
+    positions = {}
+    mask_rows = []
+    mask_cols = []
+
+    for i, val in enumerate(mask.values()):
+        if isinstance(val, str):
+            val = [val]
+
+        for column in val:
+            mask_rows.append(i)
+            mask_cols.append(positions.setdefault(column, len(positions)))
+
+    columns = list(positions)
+
+    return rows, columns, np.array(mask_rows, dtype=np.intp), np.array(mask_cols, dtype=np.intp)
+
+
+def _positions(index, labels):
+    positions = index.get_indexer(labels)
+
+    if (positions < 0).any():
+        missing = [x for x, i in zip(labels, positions) if i < 0]
+        raise KeyError(f"{missing} not in index")
+
+    return positions
+
+
+def _failedCells(df, row_ix, col_ix):
+    # tests each cell given by coordinates, one column at a time
+    failed = np.empty(row_ix.size, dtype=bool)
+
+    for j in np.unique(col_ix):
+        cells = col_ix == j
+        failed[cells] = ~(df.iloc[row_ix[cells], j] > 0).to_numpy()
+
+    return failed
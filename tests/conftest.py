@@ -0,0 +1,31 @@
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def stand_in(tmp_path):
+    """
+    Points the connection pool at the SQLite stand-in of pysql.benchmark, in a temporary
+    directory. Returns a function which creates a table from CREATE and INSERT statements.
+    """
+    import pysql.pool as pool
+    import pysql.benchmark as benchmark
+
+    def execute(query, rows=None):
+        conn = sqlite3.connect(str(tmp_path / 'benchmark.db'))
+        try:
+            if rows is None:
+                conn.execute(query)
+            else:
+                conn.executemany(query, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    previous = pool.getPool()
+    pool.setPool(pool.ConnectionPool(connect=benchmark.sqliteConnect(str(tmp_path))))
+
+    yield execute
+
+    pool.getPool().closeAll()
+    pool.setPool(previous)
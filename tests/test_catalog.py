@@ -0,0 +1,43 @@
+import threading
+import time
+import pytest
+
+try:
+    import pysql.catalog as catalog
+except ImportError:
+    # pyodbc needs an ODBC driver manager (libodbc)
+    pytest.skip('pyodbc cannot be imported', allow_module_level=True)
+
+
+def test_concurrent_lookups_load_once(stand_in, monkeypatch):
+    stand_in("CREATE TABLE sales (id INTEGER, amount REAL)")
+
+    loads = []
+    executeQuery = catalog.io.executeQuery
+
+    def countingQuery(server, database, query, *args, **kwargs):
+        if 'INFORMATION_SCHEMA.COLUMNS' in query:
+            loads.append(query)
+            # widen the window in which other threads find the catalog cold
+            time.sleep(0.1)
+        return executeQuery(server, database, query, *args, **kwargs)
+
+    monkeypatch.setattr(catalog.io, 'executeQuery', countingQuery)
+
+    schema = catalog.SchemaCatalog('benchmark', 'benchmark')
+    barrier = threading.Barrier(8)
+    found = []
+
+    def lookup():
+        barrier.wait()
+        found.append(schema.hasTable('sales'))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert found == [True] * 8
+    assert len(loads) == 1
+
@@ -0,0 +1,51 @@
+import datetime
+import pytest
+
+try:
+    import pysql.io as io
+except ImportError:
+    # pyodbc needs an ODBC driver manager (libodbc)
+    pytest.skip('pyodbc cannot be imported', allow_module_level=True)
+
+
+# cursor.description rows: name, type code, display size, internal size, precision, scale, nullable
+DESCRIPTION = [('end_date', datetime.datetime, None, None, None, None, True),
+               ('id', int, None, None, None, None, True)]
+
+
+def test_columnar_builder_sentinel_date():
+    builder = io._ColumnarBuilder(DESCRIPTION, capacity=2)
+    builder.append([(datetime.datetime(9999, 12, 31), 1),
+                    (None, 2),
+                    (datetime.datetime(2020, 1, 2, 3, 4, 5), 3)])
+
+    df = builder.toFrame()
+
+    assert df['end_date'].dtype == object
+    assert df['end_date'].tolist() == [datetime.datetime(9999, 12, 31), None,
+                                       datetime.datetime(2020, 1, 2, 3, 4, 5)]
+    assert df['id'].tolist() == [1, 2, 3]
+
+
+def test_columnar_builder_dates_in_range():
+    builder = io._ColumnarBuilder(DESCRIPTION)
+    builder.append([(datetime.datetime(2020, 1, 2), 1), (None, None)])
+
+    df = builder.toFrame()
+
+    assert df['end_date'].dtype == 'datetime64[ns]'
+    assert df['end_date'].iloc[0] == datetime.datetime(2020, 1, 2)
+    assert df['end_date'].isna().tolist() == [False, True]
+
+
+def test_iter_query_late_sentinel_date(stand_in):
+    stand_in("CREATE TABLE dates (id INTEGER, end_date TIMESTAMP)")
+    stand_in("INSERT INTO dates VALUES (?, ?)",
+             [(1, '2020-01-01 00:00:00'), (2, None), (3, '2021-06-30 12:00:00'), (4, '9999-12-31 00:00:00')])
+
+    chunks = list(io.iterQuery('benchmark', 'benchmark', "SELECT * FROM dates ORDER BY id", chunk_rows=2))
+
+    assert [chunk['end_date'].dtype for chunk in chunks] == [object, object]
+    assert chunks[0]['end_date'].tolist() == [datetime.datetime(2020, 1, 1), None]
+    assert chunks[1]['end_date'].tolist() == [datetime.datetime(2021, 6, 30, 12), datetime.datetime(9999, 12, 31)]
+    assert [chunk['id'].dtype for chunk in chunks] == ['Int64', 'Int64']
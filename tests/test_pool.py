@@ -0,0 +1,191 @@
+import random
+import threading
+import time
+import pytest
+
+try:
+    import pysql.pool as pool
+    import pysql.benchmark as benchmark
+except ImportError:
+    # pyodbc needs an ODBC driver manager (libodbc)
+    pytest.skip('pyodbc cannot be imported', allow_module_level=True)
+
+
+class FlakyConnection():
+    # stand-in connection whose health check and rollback can be made to fail
+    def __init__(self, conn):
+        self._conn = conn
+        self.healthy = True
+        self.rollback_fails = False
+        self.closed = False
+
+    def cursor(self):
+        if not self.healthy:
+            raise RuntimeError('connection lost')
+        return self._conn.cursor()
+
+    def rollback(self):
+        if self.rollback_fails:
+            raise RuntimeError('rollback failed')
+        self._conn.rollback()
+
+    def close(self):
+        self.closed = True
+        self._conn.close()
+
+
+class Factory():
+    def __init__(self, directory):
+        self._connect = benchmark.sqliteConnect(directory)
+        self.fail = False
+        self.fail_rate = 0
+        self.opened = []
+
+    def __call__(self, server, database):
+        if self.fail or random.random() < self.fail_rate:
+            raise RuntimeError('cannot connect')
+        conn = FlakyConnection(self._connect(server, database))
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def factory(tmp_path):
+    return Factory(str(tmp_path))
+
+
+def _counts(connection_pool, key=('s', 'd')):
+    return connection_pool._open.get(key, 0), len(connection_pool._idle.get(key, []))
+
+
+def test_reuses_idle_connection(factory):
+    connection_pool = pool.ConnectionPool(max_size=2, connect=factory)
+
+    with connection_pool.connection('s', 'd') as conn:
+        pass
+    with connection_pool.connection('s', 'd') as again:
+        assert again is conn
+
+    assert len(factory.opened) == 1
+    assert _counts(connection_pool) == (1, 1)
+
+
+def test_evicts_idle_connections(factory):
+    connection_pool = pool.ConnectionPool(max_size=2, idle_timeout=0.05, connect=factory)
+
+    with connection_pool.connection('s', 'd') as conn:
+        pass
+    time.sleep(0.1)
+
+    with connection_pool.connection('s', 'other'):
+        pass
+
+    assert conn.closed
+    assert _counts(connection_pool) == (0, 0)
+
+
+def test_replaces_unhealthy_connection(factory):
+    connection_pool = pool.ConnectionPool(max_size=1, connect=factory)
+
+    with connection_pool.connection('s', 'd') as conn:
+        pass
+    conn.healthy = False
+
+    with connection_pool.connection('s', 'd') as new:
+        assert new is not conn
+
+    assert conn.closed
+    assert _counts(connection_pool) == (1, 1)
+
+
+def test_connect_failure_frees_slot(factory):
+    connection_pool = pool.ConnectionPool(max_size=1, checkout_timeout=0.1, connect=factory)
+
+    factory.fail = True
+    with pytest.raises(RuntimeError):
+        connection_pool.acquire('s', 'd')
+    assert _counts(connection_pool) == (0, 0)
+
+    factory.fail = False
+    with connection_pool.connection('s', 'd'):
+        assert _counts(connection_pool) == (1, 0)
+
+
+def test_broken_rollback_closes_connection(factory):
+    connection_pool = pool.ConnectionPool(max_size=1, connect=factory)
+
+    conn = connection_pool.acquire('s', 'd')
+    conn.rollback_fails = True
+    connection_pool.release('s', 'd', conn)
+
+    assert conn.closed
+    assert _counts(connection_pool) == (0, 0)
+
+
+def test_timeout_closes_evicted_connections(factory):
+    connection_pool = pool.ConnectionPool(max_size=1, idle_timeout=0.05, checkout_timeout=0.2,
+                                          connect=factory)
+
+    held = connection_pool.acquire('s', 'd')
+    with connection_pool.connection('s', 'other') as idle:
+        pass
+
+    with pytest.raises(TimeoutError):
+        connection_pool.acquire('s', 'd')
+
+    assert idle.closed
+    assert _counts(connection_pool, ('s', 'other')) == (0, 0)
+
+    connection_pool.release('s', 'd', held)
+    assert _counts(connection_pool) == (1, 1)
+
+
+def test_concurrent_checkouts_with_failures(factory):
+    max_size = 3
+    connection_pool = pool.ConnectionPool(max_size=max_size, idle_timeout=0.01, checkout_timeout=5,
+                                          connect=factory)
+    factory.fail_rate = 0.1
+    lock = threading.Lock()
+    checked_out = []
+    peak = [0]
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+
+        for _ in range(50):
+            try:
+                conn = connection_pool.acquire('s', 'd')
+            except RuntimeError:
+                # injected connect failure
+                continue
+            except Exception as e:
+                errors.append(e)
+                return
+
+            with lock:
+                checked_out.append(conn)
+                peak[0] = max(peak[0], len(checked_out))
+
+            time.sleep(rng.random() * 0.002)
+            conn.healthy = rng.random() > 0.2
+            conn.rollback_fails = rng.random() < 0.1
+
+            with lock:
+                checked_out.remove(conn)
+            connection_pool.release('s', 'd', conn)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert peak[0] <= max_size
+
+    # every counted connection is idle, every other one is closed
+    open_count, idle_count = _counts(connection_pool)
+    assert open_count == idle_count <= max_size
+    idle = {id(conn) for conn, _ in connection_pool._idle.get(('s', 'd'), [])}
+    assert all(conn.closed for conn in factory.opened if id(conn) not in idle)
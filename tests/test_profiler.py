@@ -0,0 +1,45 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+import pysql.profiler as profiler
+
+
+def _frame():
+    dates = [datetime.datetime(2020, 1, 1), datetime.datetime(2020, 1, 2),
+             datetime.datetime(2020, 1, 1), datetime.datetime(2020, 1, 3, 12, 30)]
+
+    return pd.DataFrame({'date': pd.Series(dates, dtype='datetime64[ns]'),
+                         'duration': pd.to_timedelta(['1D', '2D', '1D', '2D 1h']),
+                         'name': ['a', '', None, 'a'],
+                         'value': [1.5, np.nan, 1.5, 3.0]})
+
+
+def _split(df, rows):
+    return [df.iloc[i:i + rows] for i in range(0, df.shape[0], rows)]
+
+
+def test_split_chunks_report_as_one_chunk():
+    df = _frame()
+    expected = profiler.StreamingProfiler().update(df).report()
+
+    for rows in (1, 2, 3):
+        report = profiler.profileChunks(_split(df, rows)).report()
+        pd.testing.assert_frame_equal(report, expected)
+
+
+def test_merged_profilers_report_as_one_chunk():
+    df = _frame()
+    expected = profiler.StreamingProfiler().update(df).report()
+
+    first, second = (profiler.StreamingProfiler().update(x) for x in _split(df, 2))
+
+    pd.testing.assert_frame_equal(first.merge(second).report(), expected)
+
+
+def test_dates_hash_alike_in_every_chunk():
+    report = profiler.profileChunks(_split(_frame(), 2)).report().set_index('Column Name')
+
+    assert report.loc['date', 'Distinct'] == 3
+    assert report.loc['date', 'Top Values'][0] == ('2020-01-01T00:00:00.000000000', 2)
+    assert report.loc['date', 'Min Length'] == report.loc['date', 'Max Length']